@@ -3,10 +3,15 @@ import sys
 import json
 import random
 import os
+import multiprocessing
 
 sys.path.append('src')
 from controller.controller_player import ControllerPlayer
 from controller.controller_ai import ControllerAI
+from controller.controller_islands import ControllerIslands
+from controller.controller_distributed import ControllerCoordinator, ControllerWorker
+from transport import connect, get_authkey
+from ga_archive import GAArchive
 from interface import Interface
 
 # Interface:
@@ -15,16 +20,45 @@ from interface import Interface
 # python3 main.py src/config.json -player
 # GA not visible trainning:
 # python3 main.py src/config.json -notv
-# !!Warning!! When using -reuse, must use it just after config.json, otherwise
+# GA trainning without display, frame pacing or events (e.g. on servers):
+# python3 main.py src/config.json -headless
+# GA trainning with the population split in islands, one process for each:
+# python3 main.py src/config.json -islands 4
+# GA trainning evaluated by workers (local processes, or tcp/unix sockets):
+# python3 main.py src/config.json -transport local -workers 4
+# python3 main.py src/config.json -transport tcp -address localhost:6000
+# python3 main.py src/config.json -worker localhost:6000 -authkey [key]
+# !!Warning!! Messages between coordinator and workers are pickles, anyone
+# that knows the key can run code in both. The coordinator prints a random
+# key if there's no -authkey (or CAR_RACING_AUTHKEY). The port is not safe
+# to be exposed, from other machines reach it with a ssh tunnel or a
+# trusted network.
+# !!Warning!! When using -reuse or -resume, must use it just after config.json, otherwise
 # it will overwrite the commands before.
 # reuse GA:
 # python3 main.py src/config.json -reuse [ga path] [generation]
+# GA trainning with each individual evaluated in a set of circuits at once:
+# python3 main.py src/config.json -tracks '["ellipse", "circle", "kart"]'
+# GA trainning without generations, each car gets a new individual when it's evaluated:
+# python3 main.py src/config.json -steady
+# GA trainning of a neural network with hidden layers of 16 and 8 units:
+# python3 main.py src/config.json -policy mlp -hidden '[16, 8]'
+# GA trainning skipping individuals already evaluated, kept in a cache of features:
+# python3 main.py src/config.json -cache_size 100000 -cache_file [file]
 # reuse GA in another circuit:
 # python3 main.py src/config.json -reuse [ga path] [generation] -track [track_name]
-
-pygame.init()
+# continue an interrupted GA, with the same results as if it wasn't interrupted:
+# python3 main.py src/config.json -resume [ga path]
+# export generations of the binary archive of a GA as gen_[generation].json:
+# python3 main.py src/config.json -export [ga path]
+# Collisions and vision only test the walls in the cells of a grid
+# (collisions.grid_cell_size pixels) near each segment, with the same results
+# as testing every wall. Runs from before the grid can differ by a frame in a
+# few cars: orient/inDisk rounded the points of the car in each wall tested,
+# so results depended on how many walls were tested.
 
 if len(sys.argv) == 1:
+    pygame.init()
     Interface().run()
     exit(0)
 
@@ -45,23 +79,44 @@ print("Available circuits:", available_circuits)
 
 options = {
     '-track' : ['track', str],
+    '-tracks' : ['ai', 'tracks', json.loads],
     '-fps' : ['fps', int],
     '-fps_info' : ['fps_info', int],
+    '-threads' : ['collisions', 'threads', int],
     '-pop_sz' : ['ai', 'population_size', int],
+    '-optimizer' : ['ai', 'optimizer', str],
+    '-policy' : ['ai', 'policy', str],
+    '-hidden' : ['ai', 'hidden_layers', json.loads],
+    '-selection' : ['ai', 'selection', str],
     '-mut_type' : ['ai', 'mutation_type', str],
     '-mut_chance' : ['ai', 'mutation_chance', float],
     '-mut_factor' : ['ai', 'mutation_factor', float],
     '-num_gen' : ['ai', 'num_of_generations', int],
     '-max_frames' : ['ai', 'max_frames', int],
+    '-dec_interval' : ['ai', 'decision_interval', int],
+    '-pruning' : ['ai', 'pruning_checkpoints', json.loads],
+    '-cache_size' : ['ai', 'cache_size', int],
+    '-cache_file' : ['ai', 'cache_file', str],
+    '-islands' : ['ai', 'islands', int],
+    '-transport' : ['distributed', 'transport', str],
+    '-workers' : ['distributed', 'workers', int],
+    '-address' : ['distributed', 'address', str],
+    '-authkey' : ['distributed', 'authkey', str],
 
     '-player' : ['PLAYER'],
     '-reuse' : ['LOAD'],
+    '-resume' : ['RESUME'],
+    '-worker' : ['WORKER'],
+    '-export' : ['EXPORT'],
     '-tv' : ['SET', 'graphics', True],
     '-notv' : ['SET', 'graphics', False],
+    '-headless' : ['SET', 'headless', True],
+    '-sdf' : ['SET', 'collisions', 'distance_field', True],
     '-save' : ['SET', 'ai', 'save', True],
     '-nosave' : ['SET', 'ai', 'save', False],
     '-train': ['SET', 'ai', 'train', True],
-    '-notrain': ['SET', 'ai', 'train', False]
+    '-notrain': ['SET', 'ai', 'train', False],
+    '-steady': ['SET', 'ai', 'steady_state', True]
 }
 
 game_now = "GA"
@@ -72,10 +127,34 @@ while i < len(sys.argv):
         game_now = "PLAYER"
     elif now[0] == 'LOAD':
         config = json.load(open(os.path.join(sys.argv[i+1], 'config.json'), 'r'))
-        ai_info = json.load(open(os.path.join(sys.argv[i+1], 'gen_' + sys.argv[i+2] + '.json'), 'r'))
+        if GAArchive.exists(sys.argv[i+1]):
+            ai_info = GAArchive(sys.argv[i+1]).load(int(sys.argv[i+2]))
+        else:
+            ai_info = json.load(open(os.path.join(sys.argv[i+1], 'gen_' + sys.argv[i+2] + '.json'), 'r'))
         config['reuse'] = sys.argv[i+1]
         game_now = "GA_INFO"
         i += 2
+    elif now[0] == 'RESUME':
+        # Continues the run from the checkpoint of the last generation started
+        checkpoint_path = os.path.join(sys.argv[i+1], 'checkpoint.json')
+        if not os.path.exists(checkpoint_path):
+            print("No checkpoint in", sys.argv[i+1])
+            exit(0)
+        config = json.load(open(os.path.join(sys.argv[i+1], 'config.json'), 'r'))
+        ai_info = json.load(open(checkpoint_path, 'r'))
+        config['resume'] = sys.argv[i+1]
+        game_now = "GA_INFO"
+        i += 1
+    elif now[0] == 'EXPORT':
+        # Writes each generation of the archive as gen_N.json
+        archive = GAArchive(sys.argv[i+1])
+        for generation in archive.get_generations():
+            archive.export_json(generation, os.path.join(sys.argv[i+1], 'gen_%d.json' % generation))
+        exit(0)
+    elif now[0] == 'WORKER':
+        game_now = "WORKER"
+        worker_address = sys.argv[i+1]
+        i += 1
     elif now[0] == 'SET':
         cnf = config
         for j in range(1, len(now)-2):
@@ -88,9 +167,47 @@ while i < len(sys.argv):
         cnf[now[-2]] = now[-1](sys.argv[i+1])
         i+=1
     i+=1
+
+# Islands are evolved headless, each one in its own process, as the
+# populations evaluated by workers
+islands = game_now != "PLAYER" and 'islands' in config['ai'] and config['ai']['islands'] > 1
+distributed = game_now != "PLAYER" and 'distributed' in config and \
+                config['distributed']['transport'] != "none"
+if distributed and 'steady_state' in config['ai'] and config['ai']['steady_state']:
+    print("Steady state is not available with workers.")
+    exit(0)
+if islands and 'resume' in config:
+    print("-resume is not available with islands.")
+    exit(0)
+if 'resume' in config and 'steady_state' in config['ai'] and config['ai']['steady_state']:
+    print("-resume is not available with steady state.")
+    exit(0)
+if islands or distributed or game_now == "WORKER":
+    config['headless'] = True
+
+if game_now != "PLAYER" and 'headless' in config and config['headless']:
+    config['graphics'] = False
+else:
+    config['headless'] = False
+    pygame.init()
+
 if game_now == "GA":
-    game_now = ControllerAI(config)
-elif game_now == "GA_INFO":
+    ai_info = None
+if game_now == "WORKER":
+    authkey = get_authkey(config)
+    if authkey == None:
+        exit(0)
+    try:
+        conn = connect(worker_address, authkey)
+    except (OSError, multiprocessing.AuthenticationError) as e:
+        print("Unable to join the coordinator in %s:" % worker_address, e)
+        exit(0)
+    game_now = ControllerWorker(conn)
+elif game_now in ("GA", "GA_INFO") and distributed:
+    game_now = ControllerCoordinator(config, ai_info)
+elif game_now in ("GA", "GA_INFO") and islands:
+    game_now = ControllerIslands(config, ai_info)
+elif game_now in ("GA", "GA_INFO"):
     game_now = ControllerAI(config, ai_info)
 else:
     config['graphics'] = True
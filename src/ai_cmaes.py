@@ -0,0 +1,98 @@
+import math
+import numpy as np
+
+from ai_ga import AIGA
+
+class AICMAES(AIGA):
+    def __init__(self, config, ai_info):
+        """Evolution strategy with covariance matrix adaptation (CMA-ES).
+        Genomes are sampled from a normal distribution whose mean, step
+        size and covariance are updated with the best half of each
+        generation. The first generation is the random (or loaded)
+        population of AIGA, evaluation and saves are the same."""
+        # Distribution, created in the first update
+        self.mean = None
+        if 'cmaes_sigma' in config['ai']:
+            self.sigma = config['ai']['cmaes_sigma']
+        else:
+            self.sigma = 0.3
+        self.cov = None
+        self.path_c = None
+        self.path_sigma = None
+        self.updates = 0
+        super().__init__(config, ai_info)
+
+    def get_state(self):
+        """Returns dict with the distribution, saved in the checkpoint."""
+        if self.mean is None:
+            return {'sigma' : self.sigma}
+        return {
+            'mean' : self.mean.tolist(),
+            'sigma' : self.sigma,
+            'cov' : self.cov.tolist(),
+            'path_c' : self.path_c.tolist(),
+            'path_sigma' : self.path_sigma.tolist(),
+            'updates' : self.updates
+        }
+
+    def set_state(self, state : dict):
+        """Sets the distribution saved in the checkpoint."""
+        self.sigma = state['sigma']
+        if 'mean' in state:
+            self.mean = np.array(state['mean'], dtype=np.float64)
+            self.cov = np.array(state['cov'], dtype=np.float64)
+            self.path_c = np.array(state['path_c'], dtype=np.float64)
+            self.path_sigma = np.array(state['path_sigma'], dtype=np.float64)
+            self.updates = state['updates']
+
+    def update(self, best):
+        """Updates the distribution with best, array with the best genomes
+        flattened, sorted from the best one."""
+        mu, n = best.shape
+        weights = math.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        weights /= weights.sum()
+        mueff = 1/(weights**2).sum()
+        c_c = (4 + mueff/n)/(n + 4 + 2*mueff/n)
+        c_sigma = (mueff + 2)/(n + mueff + 5)
+        c_1 = 2/((n + 1.3)**2 + mueff)
+        c_mu = min(1 - c_1, 2*(mueff - 2 + 1/mueff)/((n + 2)**2 + mueff))
+        damps = 1 + 2*max(0, math.sqrt((mueff - 1)/(n + 1)) - 1) + c_sigma
+        chi_n = math.sqrt(n)*(1 - 1/(4*n) + 1/(21*n*n))
+
+        if self.mean is None:
+            self.mean = weights @ best
+            self.cov = np.eye(n)
+            self.path_c = np.zeros(n)
+            self.path_sigma = np.zeros(n)
+            return
+
+        old_mean = self.mean
+        self.mean = weights @ best
+        y = (best - old_mean)/self.sigma
+        y_w = weights @ y
+        eig_values, eig_vectors = np.linalg.eigh(self.cov)
+        eig_values = np.maximum(eig_values, 1e-20)
+        inv_sqrt_cov = (eig_vectors/np.sqrt(eig_values)) @ eig_vectors.T
+
+        self.updates += 1
+        self.path_sigma = (1 - c_sigma)*self.path_sigma + \
+            math.sqrt(c_sigma*(2 - c_sigma)*mueff)*(inv_sqrt_cov @ y_w)
+        norm_sigma = np.linalg.norm(self.path_sigma)
+        h_sigma = norm_sigma/math.sqrt(1 - (1 - c_sigma)**(2*self.updates))/chi_n < 1.4 + 2/(n + 1)
+        self.path_c = (1 - c_c)*self.path_c + \
+            h_sigma*math.sqrt(c_c*(2 - c_c)*mueff)*y_w
+        self.cov = (1 - c_1 - c_mu)*self.cov + \
+            c_1*(np.outer(self.path_c, self.path_c) + (1 - h_sigma)*c_c*(2 - c_c)*self.cov) + \
+            c_mu*(y.T*weights) @ y
+        self.cov = (self.cov + self.cov.T)/2
+        self.sigma *= math.exp((c_sigma/damps)*(norm_sigma/chi_n - 1))
+
+    def breed(self, order, out):
+        """Updates the distribution with the best half of the population and
+        writes in out genomes sampled from it."""
+        flat = self.population.reshape(self.population_size, -1)
+        self.update(flat[order[::-1][:self.population_size//2]])
+        eig_values, eig_vectors = np.linalg.eigh(self.cov)
+        scale = eig_vectors*np.sqrt(np.maximum(eig_values, 0))
+        z = self.rng.standard_normal(flat.shape)
+        out.reshape(self.population_size, -1)[:] = self.mean + self.sigma*(z @ scale.T)
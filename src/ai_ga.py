@@ -2,12 +2,18 @@ import random
 import time
 import os
 import json
+import copy
+import hashlib
 import subprocess
 import numpy as np
-from copy import deepcopy
 from datetime import datetime
 
-class AIGA(object):
+from fitness_cache import FitnessCache
+from ga_archive import GAArchive
+from checkpoint_writer import CheckpointWriter, write_json
+from optimizer import Optimizer
+
+class AIGA(Optimizer):
     def __init__(self, config, ai_info):
         self.population_size = config['ai']['population_size']
         self.config = config
@@ -18,6 +24,8 @@ class AIGA(object):
         
         self.evaluated = 0
         self.features = [None for x in range(self.population_size)]
+        # False for the features that depend on the rest of the population
+        self.features_exact = [True for x in range(self.population_size)]
         self.fitness = None
         self.population = None
         
@@ -25,11 +33,43 @@ class AIGA(object):
             self.must_save = config['ai']['save']
         else:
             self.must_save = False
+        # Generations are appended to a binary archive, or saved as json
+        if 'save_format' in config['ai']:
+            self.save_format = config['ai']['save_format']
+        else:
+            self.save_format = 'binary'
+        self.archive = None
+        # Maximum amount of checkpoints waiting to be written
+        if 'save_queue_size' in config['ai']:
+            self.save_queue_size = config['ai']['save_queue_size']
+        else:
+            self.save_queue_size = 2
+        self.writer = None
+        self.config_saved = False
+        # Set when continuing a run from its checkpoint
+        self.resume_hash = None
+        self.resume_features = []
         
         # One for acc/break and the other for turns
         self.gene_amnt = 2
         self.gene_size = self.config['car']['number_of_visions'] + 1
+        # Speed and visions
+        self.num_inputs = self.gene_size
+        # With the mlp policy, the genome is a single gene with the weights
+        # and biases of each layer
+        self.policy = 'linear'
+        if 'policy' in config['ai']:
+            self.policy = config['ai']['policy']
+        if self.policy == 'mlp':
+            hidden_layers = []
+            if 'hidden_layers' in config['ai']:
+                hidden_layers = config['ai']['hidden_layers']
+            self.layers = [self.num_inputs] + hidden_layers + [self.gene_amnt]
+            self.gene_amnt = 1
+            self.gene_size = sum((a + 1)*b for a, b in zip(self.layers[:-1], self.layers[1:]))
         self.EPS = config['EPS']
+        # Seeded from random, so the seed in config also fixes the GA
+        self.rng = np.random.default_rng(random.getrandbits(64))
         
         if ai_info:
             self.set_ai_info(ai_info)
@@ -42,15 +82,46 @@ class AIGA(object):
         self.t_gen_start = time.time()
         self.fps = config['fps']
         
-        if 'max_frames' in config['ai']:
-            self.max_frames = config['ai']['max_frames']
-        else:
-            self.max_frames = config["circuit_" + config['track']]['max_frames']
+        self.max_frames = self.get_max_frames(config['track'])
+        # Each individual can be evaluated in a set of tracks, its fitness is
+        # the mean of the fitness in each one
+        self.tracks = None
+        if 'tracks' in config['ai'] and len(config['ai']['tracks']) > 0:
+            self.tracks = config['ai']['tracks']
+            self.tracks_max_frames = [self.get_max_frames(x) for x in self.tracks]
+            self.max_frames = max(self.tracks_max_frames)
+        # Gradient mutation and crossover depend on the order of the visions
+        # in the genes of the linear policy
         if not 'mutation_type' in config['ai'] or \
-            config['ai']['mutation_type'] == 'simple':
+            config['ai']['mutation_type'] == 'simple' or self.policy == 'mlp':
             self.mutation = self.mutation_simple
         else:
             self.mutation = self.mutation_gradient
+        if self.policy == 'mlp':
+            self.crossover = self.crossover_units
+
+        if 'selection' in config['ai'] and config['ai']['selection'] == 'tournament':
+            self.selection = self.selection_tournament
+        else:
+            self.selection = self.selection_roulette
+        if 'tournament_size' in config['ai']:
+            self.tournament_size = config['ai']['tournament_size']
+        else:
+            self.tournament_size = 2
+
+        # Features of individuals already evaluated, the simulation is
+        # deterministic
+        self.cache = None
+        if 'cache_size' in config['ai'] and config['ai']['cache_size'] > 0:
+            cache_file = None
+            if 'cache_file' in config['ai']:
+                cache_file = config['ai']['cache_file']
+            self.cache = FitnessCache(self.get_evaluation_context(),
+                                        config['ai']['cache_size'], cache_file)
+            # Features saved in the checkpoint
+            for genome, features in zip(self.population, self.resume_features):
+                if features != None:
+                    self.cache.put(genome, features)
 
         self.mutation_chance = config['ai']['mutation_chance']
         self.mutation_factor = config['ai']['mutation_factor']
@@ -59,6 +130,8 @@ class AIGA(object):
         if self.pop_size_crossover%2:
             self.pop_size_crossover -= 1
         self.pop_size_new = self.population_size - self.pop_size_crossover - self.pop_size_elitism
+        # Next generation is written in this buffer, then both are swapped
+        self.population_next = np.empty_like(self.population)
 
         try:
             label_last_commit = \
@@ -73,209 +146,438 @@ class AIGA(object):
             self.config["track"] + \
             datetime.now().strftime("__%Y-%d-%m_%H-%M-%S") + \
             "__git-" + label_last_commit
-        if self.must_save:
+        if 'island' in config['ai']:
+            self.identifier += "__island-" + str(config['ai']['island'])
+        self.folder_path = os.path.join("ga", self.identifier)
+        if 'resume' in config:
+            # Continues saving in the folder of the run, config.json is there
+            self.folder_path = config['resume']
+            self.identifier = os.path.basename(os.path.normpath(config['resume']))
+            self.config_saved = True
+            if self.resume_hash != self.get_config_hash():
+                print("Config changed since the checkpoint, the run will not be the same.")
+        elif self.must_save:
             self.save()
+        if self.must_save:
+            self.save_checkpoint()
+
+    def get_max_frames(self, track : str):
+        """Returns maximum number of frames of a car in track."""
+        if 'max_frames' in self.config['ai']:
+            return self.config['ai']['max_frames']
+        return self.config["circuit_" + track]['max_frames']
 
-    def set_evaluation(self, car_id : int, features : dict):
-        """Set features of a car with car_id based on received features."""
+    def get_evaluation_context(self):
+        """Returns dict with the configs, besides the genome, that change the
+        features of an individual."""
+        config = self.config
+        car_keys = ['number_of_visions', 'vision_length', 'car_width', 'car_height', 'amount_graphics']
+        context = {
+            'track' : config['track'],
+            'circuit' : config['circuit_' + config['track']],
+            'max_frames' : self.max_frames,
+            'car' : {x : config['car'][x] for x in car_keys},
+            'decision_interval' : 1,
+            'collisions' : {}
+        }
+        if 'decision_interval' in config['ai']:
+            context['decision_interval'] = config['ai']['decision_interval']
+        if self.policy == 'mlp':
+            context['layers'] = self.layers
+        if self.tracks != None:
+            context['tracks'] = [[x, config['circuit_' + x], y]
+                                    for x, y in zip(self.tracks, self.tracks_max_frames)]
+        if 'collisions' in config:
+            # The folder of the saved fields doesn't change the features
+            collisions_keys = ['sector_culling', 'distance_field', 'distance_field_resolution',
+                                'distance_field_tolerance', 'distance_field_steps']
+            context['collisions'] = {x : config['collisions'][x] for x in collisions_keys
+                                        if x in config['collisions']}
+        return context
+
+    def get_config_hash(self):
+        """Returns hash of the configs that change the evolution, compared
+        when resuming a run."""
+        ai_config = {x : self.config['ai'][x] for x in self.config['ai']
+                        if not x in ['num_of_generations', 'save', 'save_format', 'save_queue_size']}
+        data = json.dumps({'ai' : ai_config, 'context' : self.get_evaluation_context()}, sort_keys=True)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def ask(self):
+        """Returns the population to be evaluated."""
+        return self.population
+
+    def set_evaluation(self, car_id : int, features : dict, exact = True):
+        """Set features of a car with car_id based on received features.
+        exact is False when the features depend on the rest of the
+        population (pruned cars), so they aren't cached."""
         if self.features[car_id] == None:
             self.features[car_id] = features
+            self.features_exact[car_id] = exact
             self.evaluated+=1
+            if self.cache != None and exact:
+                self.cache.put(self.population[car_id], features)
+
+    def evaluate_cached(self, car_ids = None):
+        """Sets features of the individuals found in the cache, of car_ids
+        or of the whole population. Returns list with their ids."""
+        ret = []
+        if car_ids is None:
+            car_ids = range(self.population_size)
+        if self.cache != None:
+            for car_id in car_ids:
+                car_id = int(car_id)
+                features = self.cache.get(self.population[car_id])
+                if features != None and self.features[car_id] == None:
+                    self.set_evaluation(car_id, features)
+                    ret.append(car_id)
+        return ret
 
     def population_evaluated(self):
         """Returns if the whole population was evaluated."""
         return self.evaluated == self.population_size
 
     def random_population(self, n):
-        """Generate n random individuals."""
-        ret = []
-        for i in range(n):
-            ret.append([[random.uniform(-1, 1) for j in range(self.gene_size)]
-                            for i in range(self.gene_amnt)])
-
-        return ret
+        """Generate n random individuals, array with shape
+        (n, gene_amnt, gene_size)."""
+        return self.rng.uniform(-1, 1, (n, self.gene_amnt, self.gene_size))
 
     def calc_movement(self, car_id, vision, speed):
         """Based on car with car_id AI, it's vision and speed at the moment,
         returns movement list."""
-        mov = []
-        indv = self.population[car_id]
-        for i in range(self.gene_amnt):
-            gene = indv[i]
-            total = (gene[0]*speed)/self.config['car']['number_of_visions']
-            for j in range(1, self.gene_size):
-                total += gene[j]*vision[j-1]
-            mov.append(total)
-        return mov
+        return self.calc_movements([car_id], [vision], [speed])[0].tolist()
 
-    def calc_fitness(self):
-        """Calculate fitness of the population based on features."""
-        self.fitness = []
-        for i in range(self.population_size):
-            feat = self.features[i]
-            if feat['perc_of_sectors'] < 1.0-self.EPS:
-                self.fitness.append(100*feat['perc_of_sectors'] +
-                    (self.max_frames - feat['amount_frames'])/(2*self.max_frames))
-            else:
-                self.fitness.append(100*feat['perc_of_sectors'] +
-                    (self.max_frames - feat['amount_frames']))
-    
-    def clamp(self, x, mini, maxi):
-        """Apply clamp to x."""
-        if x > maxi:
-            return maxi
-        elif x < mini:
-            return mini
+    def calc_movements(self, car_ids, visions, speeds):
+        """Based on the AI of the cars with car_ids, their visions, array with
+        shape (len(car_ids), number_of_visions), and speeds at the moment,
+        returns movement array with shape (len(car_ids), gene_amnt). The
+        first position of each gene weights the speed, the others the vision."""
+        car_ids = np.asarray(car_ids, dtype=np.int64)
+        obs = np.empty((len(car_ids), self.num_inputs))
+        obs[:, 0] = np.asarray(speeds)/self.config['car']['number_of_visions']
+        obs[:, 1:] = visions
+        if self.policy == 'mlp':
+            return self.calc_mlp(self.get_genomes(car_ids)[:, 0], obs)
+        return np.einsum('ijk,ik->ij', self.get_genomes(car_ids), obs)
+
+    def calc_mlp(self, genomes, obs):
+        """Returns array with shape (n, 2), the output of the mlp of each
+        genome for the input in the same row of obs. Hidden layers use tanh,
+        the output is linear, as the linear policy."""
+        x = obs
+        offset = 0
+        for i, (a, b) in enumerate(zip(self.layers[:-1], self.layers[1:])):
+            weights = genomes[:, offset:offset + a*b].reshape(-1, a, b)
+            bias = genomes[:, offset + a*b:offset + (a + 1)*b]
+            offset += (a + 1)*b
+            x = np.einsum('ij,ijk->ik', x, weights) + bias
+            if i < len(self.layers) - 2:
+                np.tanh(x, out=x)
         return x
-    
-    def mutation_simple(self, indv):
-        """Apply mutation to indv in place. Work by adding a random value in the
-        interval [-self.mutation_factor, self.mutation_factor] to each position
-        and aplying clamp so each value is in the range [-1, 1]."""
-        for j in range(self.gene_amnt):
-            for k in range(self.gene_size):
-                if random.random() < self.mutation_chance:
-                    indv[j][k] += random.uniform(-self.mutation_factor, self.mutation_factor)
-                    self.clamp(indv[j][k], -1, 1)
-                    
-    def mutation_gradient(self, indv):
-        """Apply mutation to indv in place. There's two type of mutation in this
-        function, the first is applied to speed, and it's equivalent to
-        mutation_simple, the second is for the rest of the gene, that is
-        responsible for vision, and works by setting three points, left, center
-        and right and applying a random value to this position that degredes
-        as it is spread to all it neighbours."""
-        for i in range(self.gene_amnt):
-            indv[i][0] += random.uniform(-self.mutation_factor, self.mutation_factor)
-            indv[i][0] = self.clamp(indv[i][0], -1, 1)
 
+    def get_genomes(self, car_ids):
+        """Returns array with the genomes driving the cars with car_ids."""
+        return self.population[car_ids]
+
+    def calc_fitness(self):
+        """Calculate fitness of the population based on features. With a set
+        of tracks, it's the mean of the fitness in each track."""
+        self.fitness = self.get_fitness(self.features).tolist()
+
+    def get_fitness(self, features : list):
+        """Returns array with the fitness of each features."""
+        if self.tracks == None:
+            return self.features_fitness(features, self.max_frames)
+        return np.mean([self.features_fitness([x['tracks'][i] for x in features], max_frames)
+                        for i, max_frames in enumerate(self.tracks_max_frames)], axis=0)
+
+    def features_fitness(self, features : list, max_frames : int):
+        """Returns array with the fitness of each features, of a track with
+        max_frames."""
+        perc = np.array([x['perc_of_sectors'] for x in features], dtype=np.float64)
+        frames = np.array([x['amount_frames'] for x in features], dtype=np.float64)
+        # Cars that finished are rewarded by each frame left
+        return 100*perc + np.where(perc < 1.0-self.EPS,
+                            (max_frames - frames)/(2*max_frames),
+                            max_frames - frames)
+
+    def get_best(self, n):
+        """Returns the n individuals with the highest fitness of the evaluated
+        population, best first, and their features."""
+        self.calc_fitness()
+        order = np.argsort(self.fitness, kind='stable')[::-1][:n]
+        return self.population[order].copy(), [self.features[i] for i in order]
+
+    def migrate(self, population, features):
+        """Replaces the individuals with the lowest fitness of the evaluated
+        population by the received ones, already evaluated with features.
+        Their fitness is updated too, steady state replaces the lowest one."""
+        self.calc_fitness()
+        order = np.argsort(self.fitness, kind='stable')[:len(population)]
+        self.population[order] = population
+        for i, feat, fitness in zip(order, features, self.get_fitness(features)):
+            self.features[i] = feat
+            self.fitness[i] = float(fitness)
+
+    def selection_roulette(self, n):
+        """Returns indexes of n individuals drawn with probability
+        proportional to their fitness."""
+        fitness = np.asarray(self.fitness)
+        total = fitness.sum()
+        if total <= 0:
+            return self.rng.integers(0, len(fitness), n)
+        cum = np.cumsum(fitness)
+        ret = np.searchsorted(cum, self.rng.random(n)*total, side='right')
+        return np.minimum(ret, len(fitness) - 1)
+
+    def selection_tournament(self, n):
+        """Returns indexes of n individuals, each one is the best of
+        tournament_size individuals drawn uniformly."""
+        fitness = np.asarray(self.fitness)
+        candidates = self.rng.integers(0, len(fitness), (n, self.tournament_size))
+        best = fitness[candidates].argmax(axis=1)
+        return candidates[np.arange(n), best]
+
+    def mutation_simple(self, pop):
+        """Apply mutation to pop, array of individuals, in place. Work by
+        adding a random value in the interval [-self.mutation_factor,
+        self.mutation_factor] to each position with mutation_chance and
+        aplying clamp so each value is in the range [-1, 1]."""
+        mask = self.rng.random(pop.shape) < self.mutation_chance
+        delta = self.rng.uniform(-self.mutation_factor, self.mutation_factor, pop.shape)
+        pop += np.where(mask, delta, 0)
+        np.clip(pop, -1, 1, out=pop)
+
+    def mutation_gradient_weights(self):
+        """Returns array with shape (3, gene_size), the weights of the left,
+        center and right mutations of mutation_gradient in each position."""
+        if not hasattr(self, 'gradient_weights'):
+            num_of_visions = self.config['car']['number_of_visions']
+            k = np.arange(self.gene_size)
             left = 1
-            if random.random() < self.mutation_chance:
-                div = 1
-                mut = random.uniform(-self.mutation_factor, self.mutation_factor)
-                for j in range (left, self.gene_size):
-                    indv[i][j] += mut/div
-                    indv[i][j] = self.clamp(indv[i][j], -1, 1)
-                    div *= 2
-
-            center = self.config['car']['number_of_visions']//2 + 1
-            if random.random() < self.mutation_chance:
-                div = 1
-                mut = random.uniform(-self.mutation_factor, self.mutation_factor)
-                for j in range (center):
-                    indv[i][center+j] += mut/div
-                    indv[i][center+j] = self.clamp(indv[i][center+j], -1, 1)
-                    if j:
-                        indv[i][center-j] += mut/div
-                        indv[i][center-j] = self.clamp(indv[i][center-j], -1, 1)
-                    div *= 2
-
-            right = self.config['car']['number_of_visions']
-            if random.random() < self.mutation_chance:
-                div = 1
-                mut = random.uniform(-self.mutation_factor, self.mutation_factor)
-                for j in range (right, left, -1):
-                    indv[i][j] += mut/div
-                    indv[i][j] = self.clamp(indv[i][j], -1, 1)
-                    div *= 2
-
-    def crossover(self, parent_1, parent_2):
-        """Returns two individuals, result of the crossover."""
+            center = num_of_visions//2 + 1
+            right = num_of_visions
+            weights = np.zeros((3, self.gene_size))
+            weights[0] = np.where(k >= left, 0.5**(k - left), 0)
+            weights[1] = np.where((k >= 1) & (np.abs(k - center) < center),
+                                    0.5**np.abs(k - center), 0)
+            weights[2] = np.where((k > left) & (k <= right), 0.5**(right - k), 0)
+            self.gradient_weights = weights
+        return self.gradient_weights
+
+    def mutation_gradient(self, pop):
+        """Apply mutation to pop, array of individuals, in place. There's two
+        type of mutation in this function, the first is applied to speed,
+        and it's equivalent to mutation_simple, the second is for the rest
+        of the gene, that is responsible for vision, and works by setting
+        three points, left, center and right and applying a random value to
+        this position that degredes as it is spread to all it neighbours."""
+        shape = pop.shape[:2]
+        pop[..., 0] += self.rng.uniform(-self.mutation_factor, self.mutation_factor, shape)
+        np.clip(pop[..., 0], -1, 1, out=pop[..., 0])
+
+        # Left, center and right, each one clamped after it's applied
+        for weights in self.mutation_gradient_weights():
+            mask = self.rng.random(shape) < self.mutation_chance
+            mut = self.rng.uniform(-self.mutation_factor, self.mutation_factor, shape)
+            touched = mask[..., None] & (weights > 0)
+            pop[:] = np.where(touched, np.clip(pop + mut[..., None]*weights, -1, 1), pop)
+
+    def crossover(self, parents_1, parents_2, out):
+        """Writes in out, array with shape (len(parents_1), 2, gene_amnt,
+        gene_size), the two individuals result of the crossover of each pair
+        of parents, already mutated."""
+        n = len(parents_1)
         # Proportion from each parent
-        proportion_vision = random.randint(0, self.gene_size//2)
+        proportion_vision = self.rng.integers(0, self.gene_size//2, n, endpoint=True)[:, None]
         mid_left = (self.gene_size-2)//2 - proportion_vision
         mid_right = (self.gene_size-1)//2 + proportion_vision
-        dominant_speed = random.randint(0, 1)
-        
-        def apply(p_1, p_2):
-            """Apply crossover."""
-            indv = deepcopy(p_1)
-            for i in range(self.gene_amnt):
-                if not dominant_speed:
-                    indv[i][0] = p_2[i][0]
-                for k in range(mid_left+1, mid_right):
-                    indv[i][k] = p_2[i][k]
+        dominant_speed = self.rng.integers(0, 1, n, endpoint=True)[:, None]
 
-            self.mutation(indv)
-            return indv
+        # Positions of the genes that come from the second parent
+        k = np.arange(self.gene_size)
+        mask = ((k > mid_left) & (k < mid_right)) | ((k == 0) & (dominant_speed == 0))
+        mask = mask[:, None, :]
+        out[:, 0] = np.where(mask, parents_2, parents_1)
+        out[:, 1] = np.where(mask, parents_1, parents_2)
+        self.mutation(out.reshape(-1, self.gene_amnt, self.gene_size))
 
-        return [apply(parent_1, parent_2),
-                apply(parent_2, parent_1)]
+    def get_units(self):
+        """Returns array with the unit of the mlp of each position of the
+        genome, the unit whose input is weighted by it, or its bias."""
+        if not hasattr(self, 'units'):
+            units = []
+            first = 0
+            for a, b in zip(self.layers[:-1], self.layers[1:]):
+                units.append(np.tile(np.arange(first, first + b), a + 1))
+                first += b
+            self.units = np.concatenate(units)
+        return self.units
+
+    def crossover_units(self, parents_1, parents_2, out):
+        """Crossover of the mlp genomes, same as crossover, but each unit of
+        the children has all its weights and bias from the same parent."""
+        units = self.get_units()
+        mask = self.rng.random((len(parents_1), units.max() + 1)) < 0.5
+        mask = mask[:, None, units]
+        out[:, 0] = np.where(mask, parents_2, parents_1)
+        out[:, 1] = np.where(mask, parents_1, parents_2)
+        self.mutation(out.reshape(-1, self.gene_amnt, self.gene_size))
 
     def save(self):
-        """Save data about the AI in specific folder."""
-        folder_path = os.path.join("ga", self.identifier)
-        if not os.path.exists("ga"):
-            os.makedirs("ga")
+        """Save data about the AI in specific folder. Files are written by
+        the checkpoint writer, from a copy of the data, so the simulation
+        doesn't wait for the disk."""
+        folder_path = self.folder_path
         if not os.path.exists(folder_path):
             os.makedirs(folder_path)
+        if self.writer == None:
+            self.writer = CheckpointWriter(self.save_queue_size)
         file_path = os.path.join(
             folder_path,
             "config.json"
         )
-        if self.generation == 0 or not os.path.exists(file_path):
-            json.dump(self.config, open(file_path, 'w'))
+        if not self.config_saved:
+            config = copy.deepcopy(self.config)
+            # The key of the workers isn't written with the run
+            if 'distributed' in config and 'authkey' in config['distributed']:
+                config['distributed']['authkey'] = ""
+            self.writer.submit(write_json, config, file_path)
+            self.config_saved = True
+        elif self.save_format == 'json':
+            self.writer.submit(self.save_json, self.population.copy(), self.generation,
+                                list(self.features), list(self.fitness),
+                                os.path.join(folder_path, "gen_" + str(self.generation) + ".json"))
         else:
-            ai_info = {
-                'population' : self.population,
-                'generation' : self.generation,
-                'features' : self.features,
-                'fitness' : self.fitness
-            }
-            file_path = os.path.join(
-                folder_path,
-                "gen_" + str(self.generation) + ".json"
-            )
-            json.dump(ai_info, open(file_path, 'w'))
+            if self.archive == None:
+                self.archive = GAArchive(folder_path)
+            self.writer.submit(self.archive.append, self.generation, self.population.copy(),
+                                list(self.fitness), list(self.features))
+
+    def save_json(self, population, generation, features, fitness, file_path):
+        """Writes generation in file_path as json."""
+        ai_info = {
+            'population' : population.tolist(),
+            'generation' : generation,
+            'features' : features,
+            'fitness' : fitness
+        }
+        write_json(ai_info, file_path)
+
+    def save_checkpoint(self):
+        """Saves the population still not evaluated, with the generation and
+        the state of the random generators, so the run is continued
+        exactly from here with -resume."""
+        if not os.path.exists(self.folder_path):
+            os.makedirs(self.folder_path)
+        if self.writer == None:
+            self.writer = CheckpointWriter(self.save_queue_size)
+        state = random.getstate()
+        checkpoint = {
+            'population' : self.population.copy(),
+            'generation' : self.generation,
+            'random_state' : [state[0], list(state[1]), state[2]],
+            'rng_state' : self.rng.bit_generator.state,
+            'config_hash' : self.get_config_hash(),
+            'optimizer' : self.get_state()
+        }
+        # Features of the individuals already evaluated (elites), put back
+        # in the cache when resuming
+        if self.cache != None:
+            checkpoint['features_cached'] = [self.cache.peek(x) for x in self.population]
+        self.writer.submit(self.write_checkpoint, checkpoint,
+                            os.path.join(self.folder_path, "checkpoint.json"))
+
+    def get_state(self):
+        """Returns dict with the state of the optimizer, besides the
+        population, saved in the checkpoint. The GA has no state, the next
+        generation only depends on the population and the random
+        generators, also in the checkpoint."""
+        return {}
+
+    def set_state(self, state : dict):
+        """Sets the state of the optimizer saved in the checkpoint. The GA
+        has no state, so it must be empty, otherwise the checkpoint is of
+        another optimizer."""
+        if state:
+            print("Checkpoint is of another optimizer.")
+            exit(0)
+
+    def write_checkpoint(self, checkpoint, file_path):
+        """Writes checkpoint in file_path as json."""
+        checkpoint['population'] = checkpoint['population'].tolist()
+        write_json(checkpoint, file_path)
+
+    def close(self):
+        """Waits for the checkpoints not written yet and closes the file of
+        the cache."""
+        if self.writer != None:
+            self.writer.close()
+        if self.cache != None:
+            self.cache.close()
 
     def load_generation(self, ga_folder_path : str, generation : int):
         """Loads specified generation from folder ga_folder_path."""
-        load(os.path.join(ga_folder_path, "gen_" + str(generation)))
+        if GAArchive.exists(ga_folder_path):
+            self.set_ai_info(GAArchive(ga_folder_path).load(generation))
+        else:
+            self.load(os.path.join(ga_folder_path, "gen_" + str(generation) + ".json"))
 
     def load(self, file_path):
         """Loads generation saved on json in file_path."""
-        self.load(json.load(open(file_path, 'r')))
+        with open(file_path, 'r') as f:
+            self.set_ai_info(json.load(f))
 
     def set_ai_info(self, ai_info):
         """Sets attributes of class based on ai_info."""
         self.generation = ai_info['generation']
         self.features = [None for i in range(self.population_size)]
+        self.features_exact = [True for i in range(self.population_size)]
         self.fitness = None
-        if len(ai_info['population']) >= self.population_size:
-            self.population = ai_info['population'][-self.population_size:]
+        population = np.array(ai_info['population'], dtype=np.float64)
+        # Old format, with four genes, the second and fourth are discarded
+        if population.shape[1] == 4:
+            population = population[:, [0, 2]]
+        if population.shape[1:] != (self.gene_amnt, self.gene_size):
+            print("Loaded individuals don't match the policy of config.")
+            exit(0)
+        if len(population) >= self.population_size:
+            self.population = population[-self.population_size:]
         else:
-            sz_new = self.population_size - len(ai_info['population'])
-            self.population = ai_info['population'] + self.random_population(sz_new)
-        if len(self.population[0]) == 4:
-            for i in range(len(self.population)):
-                self.population[i][1] = self.population[i][2]
-                self.population[i] = self.population[i][:2]
-
-    def next_generation(self):
-        """If the number of generation was achieved, returns False, else,
-        generates next generation."""
-        if self.generation == self.num_generations:
-            if self.verbose > 0:
-                print("Generation %d. Previous in %.2f s" % (self.generation, time.time() - self.t_gen_start))
-            if self.verbose > 1:
-                print("Last generation:")
-                for i in range(len(self.population)):
-                    print(self.population[i], self.features[i])
-            if self.verbose > 0:
-                print("")
+            sz_new = self.population_size - len(population)
+            self.population = np.concatenate([population, self.random_population(sz_new)])
+        # Checkpoint, the random generators continue from where they were
+        if 'random_state' in ai_info:
+            state = ai_info['random_state']
+            random.setstate((state[0], tuple(state[1]), state[2]))
+            self.rng.bit_generator.state = ai_info['rng_state']
+            self.resume_hash = ai_info['config_hash']
+            if 'optimizer' in ai_info:
+                self.set_state(ai_info['optimizer'])
+            if 'features_cached' in ai_info:
+                self.resume_features = ai_info['features_cached']
 
-            return False
+    def breed(self, order, out):
+        """Writes in out the next population, order has the indexes of the
+        population sorted by fitness."""
+        elitism = self.pop_size_elitism
+        crossover = elitism + self.pop_size_crossover
+        out[:elitism] = self.population[order[::-1][:elitism]]
+        parents = self.selection(self.pop_size_crossover)
+        self.crossover(self.population[parents[0::2]], self.population[parents[1::2]],
+                out[elitism:crossover].reshape(-1, 2, self.gene_amnt, self.gene_size))
+        out[crossover:] = self.random_population(self.pop_size_new)
 
-        self.calc_fitness()
-        sorted_by_fitness = list(zip(self.fitness, self.features, self.population))
-        sorted_by_fitness.sort(key=lambda x : (x[0], x[2]))
+    def print_generation(self, sorted_by_fitness : list):
+        """Prints fitness of the evaluated generation, receives list of
+        (fitness, features) sorted by fitness."""
         if self.verbose > 0:
             print("Generation %d. Evaluated in %.2f s" % (
                 self.generation,
                 time.time() - self.t_gen_start)
             )
             qnt_top_5p = max(1, int(self.population_size*0.05))
-            top_5p = [(x,y) for x, y, _ in sorted_by_fitness][-qnt_top_5p:]
+            top_5p = sorted_by_fitness[-qnt_top_5p:]
             to_prt = [( x[0],
                         x[1]['perc_of_sectors'],
                         x[1]['amount_frames']) for x in top_5p][::-1]
@@ -284,21 +586,38 @@ class AIGA(object):
             print("\tAvr fitness: %.2f" % (sum(self.fitness)/self.population_size))
             print("\tWorst fitness: %.2f" % min(self.fitness))
 
+    def tell(self):
+        """If the number of generation was achieved, returns False, else,
+        generates next generation."""
+        if self.generation == self.num_generations:
+            if self.verbose > 0:
+                print("Generation %d. Previous in %.2f s" % (self.generation, time.time() - self.t_gen_start))
+            if self.verbose > 1:
+                print("Last generation:")
+                for i in range(len(self.population)):
+                    print(self.population[i], self.features[i])
+            if self.verbose > 0:
+                print("")
+
+            return False
+
+        if self.cache != None:
+            self.cache.flush()
+        self.calc_fitness()
+        # Sorted by fitness, ties keep the order of the population
+        order = np.argsort(self.fitness, kind='stable')
+        sorted_by_fitness = [(self.fitness[i], self.features[i]) for i in order]
+        self.print_generation(sorted_by_fitness)
+
         if (not 'train' in self.config['ai']) or self.config['ai']['train']:
-            pop_elitism = deepcopy([x for _,_,x in sorted_by_fitness][-self.pop_size_elitism:])[::-1]
-            pop_crossover = []
-            for i in range(0, self.pop_size_crossover, 2):
-                parent_1, parent_2 = map(
-                    deepcopy,
-                    random.choices(self.population, self.fitness, k=2)
-                )
-                pop_crossover.extend(self.crossover(parent_1, parent_2))
-            pop_new = self.random_population(self.pop_size_new)
-
-            self.fitness = [x for x,_,_ in sorted_by_fitness]
-            self.features = [x for _,x,_ in sorted_by_fitness]
-            self.population = [x for _,_,x in sorted_by_fitness]
+            pop_next = self.population_next
+            self.breed(order, pop_next)
 
+            self.fitness = [x for x,_ in sorted_by_fitness]
+            self.features = [x for _,x in sorted_by_fitness]
+
+            if self.must_save or self.verbose > 1:
+                self.population[:] = self.population[order]
             if self.must_save:
                 self.save()
 
@@ -307,12 +626,18 @@ class AIGA(object):
                     print(self.population[i], self.features[i], self.fitness[i])
             if self.verbose > 0:
                 print("")
-            self.population = pop_elitism + pop_crossover + pop_new
+            self.population, self.population_next = pop_next, self.population
             self.generation += 1
+            if self.must_save:
+                self.save_checkpoint()
+        self.reset_evaluation()
+
+        return True
+
+    def reset_evaluation(self):
+        """Clears features and fitness, so the population is evaluated again."""
         self.fitness = None
         self.features = [None for i in range(self.population_size)]
+        self.features_exact = [True for i in range(self.population_size)]
         self.evaluated = 0
-        self.t_gen_start = time.time()
-
-
-        return True
\ No newline at end of file
+        self.t_gen_start = time.time()
\ No newline at end of file
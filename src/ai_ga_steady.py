@@ -0,0 +1,110 @@
+import time
+import numpy as np
+
+from ai_ga import AIGA
+
+# Children found in the cache bred in a row before one is accepted anyway,
+# a converged pool may only breed cached children
+MAX_CACHED_CHILDREN = 100
+
+class AIGASteady(AIGA):
+    def __init__(self, config, ai_info):
+        """Steady state GA, there's no generation barrier. Each car is a
+        slot, as soon as the individual of a slot is evaluated it enters
+        the pool (population), replacing the worst individual if it's
+        better, and a child bred from the pool takes the slot. While the
+        pool isn't full, slots receive the initial population and then
+        random individuals. Every population_size evaluations are reported
+        and saved as a generation."""
+        super().__init__(config, ai_info)
+        # Individuals being evaluated by the cars
+        self.slots = self.population.copy()
+        self.pool_size = 0
+        self.fitness = [0.0 for i in range(self.population_size)]
+        self.proportion_new = self.pop_size_new/self.population_size
+
+    def ask(self):
+        """Returns the individuals in the slots."""
+        return self.slots
+
+    def get_genomes(self, car_ids):
+        """Returns array with the genomes in the slots car_ids."""
+        return self.slots[car_ids]
+
+    def evaluate_cached(self, car_ids = None):
+        """Children found in the cache never take a slot, they're inserted
+        in the pool when bred."""
+        return []
+
+    def set_evaluation(self, car_id : int, features : dict, exact = True):
+        """Inserts the individual of slot car_id, evaluated with features, in
+        the pool and puts a new one in the slot."""
+        if self.cache != None and exact:
+            self.cache.put(self.slots[car_id], features)
+        self.insert(self.slots[car_id], features)
+        self.slots[car_id] = self.new_individual()
+
+    def insert(self, genome, features : dict):
+        """Inserts genome in the pool, in an empty position or replacing the
+        individual with the lowest fitness if it's better."""
+        self.evaluated += 1
+        fitness = float(self.get_fitness([features])[0])
+        if self.pool_size < self.population_size:
+            i = self.pool_size
+            self.pool_size += 1
+        else:
+            i = int(np.argmin(self.fitness))
+            if fitness < self.fitness[i]:
+                return
+        self.population[i] = genome
+        self.fitness[i] = fitness
+        self.features[i] = features
+
+    def new_individual(self):
+        """Returns a new individual not found in the cache, a random one or a
+        child of two individuals of the pool. Individuals found in the cache
+        are inserted in the pool, after MAX_CACHED_CHILDREN of them the next
+        one is returned even if it's cached."""
+        for i in range(MAX_CACHED_CHILDREN + 1):
+            if self.pool_size < self.population_size or self.rng.random() < self.proportion_new:
+                child = self.random_population(1)[0]
+            else:
+                parents = self.selection(2)
+                children = np.empty((1, 2, self.gene_amnt, self.gene_size))
+                self.crossover(self.population[parents[:1]], self.population[parents[1:]], children)
+                child = children[0, 0]
+            features = None
+            if self.cache != None and i < MAX_CACHED_CHILDREN:
+                features = self.cache.get(child)
+            if features == None:
+                return child
+            self.insert(child, features)
+
+    def population_evaluated(self):
+        """Returns if population_size individuals were evaluated since the
+        last generation."""
+        return self.evaluated >= self.population_size
+
+    def save_checkpoint(self):
+        """Slots are in the middle of their evaluation, steady state runs
+        can't be resumed (main.py rejects -resume with steady_state), so
+        there's no checkpoint."""
+        pass
+
+    def tell(self):
+        """Reports and saves the pool as a generation. Returns False if the
+        number of generations was achieved."""
+        if self.generation == self.num_generations:
+            return super().tell()
+        if self.cache != None:
+            self.cache.flush()
+        order = np.argsort(self.fitness, kind='stable')
+        self.print_generation([(self.fitness[i], self.features[i]) for i in order])
+        if self.must_save:
+            self.save()
+        if self.verbose > 0:
+            print("")
+        self.generation += 1
+        self.evaluated -= self.population_size
+        self.t_gen_start = time.time()
+        return True
@@ -2,12 +2,10 @@ import pygame
 import time
 import math
 import numpy as np
-from shapely import affinity
 from shapely.geometry import LineString
-from shapely.geometry.polygon import Polygon
-from copy import deepcopy
 
 from circuit.circuit import Circuit
+from orientation_table import get_orientation_table
 
 class Car():
     MOVE_ACC = 0
@@ -73,42 +71,24 @@ class Car():
         self.update_car_angle()
 
     def generate_car_graphics(self):
-        self.car_structure = [  (self.center[0] - self.car_width/2, self.center[1] - self.car_height/2),
-                                (self.center[0] + self.car_width/2, self.center[1] - self.car_height/2),
-                                (self.center[0] + self.car_width/2, self.center[1] + self.car_height/2),
-                                (self.center[0] - self.car_width/2, self.center[1] + self.car_height/2) ]
-        self.car_front = [      (self.center[0] - self.car_width/2, self.center[1] + self.car_height/4),
-                                (self.center[0] + self.car_width/2, self.center[1] + self.car_height/4),
-                                (self.center[0] + self.car_width/2, self.center[1] + self.car_height/2),
-                                (self.center[0] - self.car_width/2, self.center[1] + self.car_height/2) ]
-
         # Car Vision
-        self.car_seg_vision = []
         self.vision_angles = np.linspace(-90, 90, self.config['number_of_visions'])
         self.vision = [1.0 for x in range(self.config['number_of_visions'])] # False, no collision
         self.car_vision_colors = self.config['car_vision_colors']
-        car_seg_vision_base = [self.center[0], self.center[1] + self.vision_length]
-        for angle_vision in self.vision_angles:
-            self.car_seg_vision.append(self.rotate_point_degree(self.center, car_seg_vision_base, -angle_vision))
-
-        # -90 makes car orientation to East, update_car_angle_exact is clockwise
-        self.update_car_angle_exact(-90)
 
         # Start PyGame surface for the car
         if self.config["graphics"]:
             self.surface = pygame.Surface((round(self.surface_side), round(self.surface_side)), pygame.SRCALPHA)
-        self.ori_car_structure = []
-        self.ori_car_front = []
-        self.ori_car_seg_vision = []
         self.generate_orientations(self.amount_graphics)
 
     def generate_orientations(self, amount):
-        """Generate orientations based on the amount of samples from 360 degress."""
-        for x in range(0, 360 + 1, 360//amount):
-            self.ori_car_structure.append(deepcopy(self.car_structure))
-            self.ori_car_front.append(deepcopy(self.car_front))
-            self.ori_car_seg_vision.append(deepcopy(self.car_seg_vision))
-            self.update_car_angle_exact(-360//amount)
+        """Set orientations based on the amount of samples from 360 degress.
+        The orientations are shared by every car with the same dimensions."""
+        table = get_orientation_table(self.car_width, self.car_height,
+                    self.config['number_of_visions'], self.vision_length, amount)
+        self.ori_car_structure = table.structure
+        self.ori_car_front = table.front
+        self.ori_car_seg_vision = table.seg_vision
 
     def apply_turn(self):
         # Apply turn to the car based on list movement
@@ -165,27 +145,6 @@ class Car():
         
         return self.movement
 
-    def update_car_angle_exact(self, angle):
-        """Updates car graphics by the angle parameter in degrees. Rotates
-        clockwise"""
-        # Car structure
-        points = self.car_structure
-        pol = affinity.rotate(Polygon(points), angle)
-        points_sep = pol.exterior.coords.xy
-        for i in range(len(points)):
-            points[i] = (points_sep[0][i], points_sep[1][i])
-
-        # Car front
-        points = self.car_front
-        pol = affinity.rotate(Polygon(points), angle, self.center)
-        points_sep = pol.exterior.coords.xy
-        for i in range(len(points)):
-            points[i] = (points_sep[0][i], points_sep[1][i])
-
-        # Vision
-        for i in range(len(self.car_seg_vision)):
-            self.car_seg_vision[i] = self.rotate_point_degree(self.center, self.car_seg_vision[i], angle)
-
     def update_car_angle(self):
         """Updates car graphics based on the angle of the velocity vector. Rotates
         clockwise with predetermined precision."""
@@ -0,0 +1,219 @@
+import pygame
+import math
+import numpy as np
+
+from orientation_table import get_orientation_table
+
+class CarFleet():
+    MOVE_ACC = 0
+    MOVE_TURN = 1
+    def __init__(self, config, size, show_vision = False):
+        """Holds the state of size cars as arrays, so the physics of the
+        whole population is stepped at once. Receives the same config as
+        car.Car, start_angle is relative to East and is anti-clockwise."""
+        self.config = config
+        self.size = size
+        if config['number_of_visions'] < 3:
+            print("number_of_visions < 3.")
+            exit(0)
+        self.amount_graphics = config['amount_graphics']
+        if 360%self.amount_graphics:
+            print("360%amount_graphics != 0")
+            exit(0)
+        self.number_of_visions = config['number_of_visions']
+        self.car_width = config['car_width']
+        self.car_height = config['car_height']
+        self.vision_length = config['vision_length']
+        self.car_color = [config['car_color'] for i in range(size)]
+        self.front_color = config['front_color']
+        self.car_vision_colors = config['car_vision_colors']
+        # Only the first car shows its vision, as in ControllerAI
+        self.show_vision = show_vision
+
+        self.EPS = 1e-6
+        self.mov_norm = 2
+        # The car is 1m x 2m, so, the amount of pixels in it car_width is a meter.
+        self.pixels_per_meter = config['car_width']
+        self.friction_movement = 0.005
+        # Acceleration in amount of pixels per iteration
+        self.acc_pixels = 0.1
+
+        self.surface_side = 1.4*max(max(config['car_width'], config['car_height']), 2*self.vision_length)
+        self.center = [round(self.surface_side/2), round(self.surface_side/2)]
+        self.generate_orientations()
+
+        # Start of each car, the same for all unless set with set_start
+        self.start_x = np.full(size, float(config['x']))
+        self.start_y = np.full(size, float(config['y']))
+        self.start_angle = np.full(size, float(config['start_angle']))
+        self.x = np.empty(size)
+        self.y = np.empty(size)
+        # Direction is stored as a unit vector
+        self.direction = np.empty((size, 2))
+        # Delta per iteration in amount of pixels
+        self.delta_pixels = np.empty(size)
+        self.friction_multiplier = np.empty(size)
+        self.ori_idx = np.empty(size, dtype=np.int64)
+        self.movement = np.empty((size, 2)) # ACC and TURN
+        self.vision = np.empty((size, self.number_of_visions))
+        self.reset()
+
+    def generate_orientations(self):
+        """Sets orientations of the car structure, front and vision from the
+        shared OrientationTable."""
+        table = get_orientation_table(self.car_width, self.car_height,
+                    self.number_of_visions, self.vision_length, self.amount_graphics)
+        self.ori_car_structure = table.structure
+        self.ori_car_front = table.front
+        self.ori_car_seg_vision = table.seg_vision
+
+    def set_start(self, car_ids, x, y, start_angle):
+        """Sets the start of the cars with car_ids, used when they're reset."""
+        self.start_x[car_ids] = x
+        self.start_y[car_ids] = y
+        self.start_angle[car_ids] = start_angle
+
+    def reset(self, car_ids = None):
+        """Resets cars with car_ids to their start and default
+        configurations. Resets all cars when car_ids is None."""
+        if car_ids is None:
+            car_ids = slice(None)
+        self.x[car_ids] = self.start_x[car_ids] - self.center[0]
+        self.y[car_ids] = self.start_y[car_ids] - self.center[1]
+        # -start_angle because start_angle is anti-clockwise.
+        angle = np.radians(-self.start_angle[car_ids])
+        self.direction[car_ids] = np.stack([np.cos(angle), np.sin(angle)], axis=-1)
+        self.delta_pixels[car_ids] = 0
+        self.friction_multiplier[car_ids] = 1
+        self.movement[car_ids] = 0
+        self.vision[car_ids] = 1.0
+        self.update_car_angle(car_ids)
+
+    def apply_turn(self, car_ids):
+        """Apply turn to the cars with car_ids based on array movement."""
+        delta_pixels = self.delta_pixels[car_ids]
+        turn_angle_intensity = np.maximum(2.25, (16 - delta_pixels)/3)
+        intensity = np.minimum(1, self.movement[car_ids, self.MOVE_TURN]/self.mov_norm)
+        # When the movement is positive, it must turn left, right otherwise
+        turn_angle = np.where(delta_pixels > self.EPS,
+                                -turn_angle_intensity*intensity, 0)
+
+        turn_angle = np.radians(turn_angle)
+        cos = np.cos(turn_angle)
+        sin = np.sin(turn_angle)
+        dx = self.direction[car_ids, 0]
+        dy = self.direction[car_ids, 1]
+        self.direction[car_ids] = np.stack([cos*dx - sin*dy, sin*dx + cos*dy], axis=1)
+
+    def apply_movement(self, car_ids = None):
+        """Apply movement to the cars with car_ids based on array movement.
+        Moves all cars when car_ids is None."""
+        if car_ids is None:
+            car_ids = np.arange(self.size)
+        self.apply_turn(car_ids)
+
+        movement_acc = self.movement[car_ids, self.MOVE_ACC]
+        intensity = np.minimum(1, movement_acc/self.mov_norm)
+        delta_pixels = self.delta_pixels[car_ids]
+        # If movement in MOVE_ACC is positive, it will accelerate. The
+        # car will break otherwise.
+        delta_pixels = np.where(movement_acc > 0,
+                                delta_pixels + self.acc_pixels*intensity,
+                                np.maximum(0, delta_pixels - 1.5*self.acc_pixels*-intensity))
+
+        # Apply acceleration
+        self.x[car_ids] += self.direction[car_ids, 0]*delta_pixels
+        self.y[car_ids] += self.direction[car_ids, 1]*delta_pixels
+
+        # Apply friction
+        self.delta_pixels[car_ids] = delta_pixels * \
+            (1 - self.friction_multiplier[car_ids] * self.friction_movement)
+        self.update_car_angle(car_ids)
+
+    def update_car_angle(self, car_ids = None):
+        """Updates index of the orientation of the cars based on the angle
+        of the velocity vector."""
+        if car_ids is None:
+            car_ids = slice(None)
+        self.ori_idx[car_ids] = np.round(
+            self.get_angle_degrees(car_ids)/(360/self.amount_graphics)).astype(np.int64)
+
+    def vector_magnitude_sum(self, vector, scalar):
+        """Sum scalar value to vector magnitude."""
+        vector = np.asarray(vector)
+        x, y = vector
+        vector_magnitude = math.sqrt(x**2 + y**2)
+        if vector_magnitude > 0:
+            vector_unit = vector/vector_magnitude
+        else:
+            vector_unit = [1, 0]
+        return vector + (vector_unit*scalar)
+
+    def draw(self, car_id):
+        """Returns surface of the car with car_id."""
+        surface = pygame.Surface((round(self.surface_side), round(self.surface_side)), pygame.SRCALPHA)
+        idx = self.ori_idx[car_id]
+        pygame.draw.polygon(surface, self.car_color[car_id], self.ori_car_structure[idx].tolist())
+        pygame.draw.polygon(surface, self.front_color, self.ori_car_front[idx].tolist())
+        if self.show_vision and car_id == 0:
+            for i, seg_vision in enumerate(self.ori_car_seg_vision[idx]):
+                vector = [seg_vision[0] - self.center[0],
+                            seg_vision[1] - self.center[1]]
+                delta = -(1-self.vision[car_id][i])*self.vision_length
+                if delta > 0:
+                    delta = 0
+                vector = self.vector_magnitude_sum(vector, delta)
+                vector[0] += self.center[0]
+                vector[1] += self.center[1]
+                pygame.draw.line(
+                    surface, (0, 254, 0),
+                    self.center,
+                    vector)
+        return surface
+
+    def get_pos_surface(self, car_id):
+        """Return position of the surface of the car with car_id in the screen."""
+        return [round(self.x[car_id]), round(self.y[car_id])]
+
+    def get_points(self, car_ids = None):
+        """Returns array of shape (len(car_ids), 4, 2) with the position of each
+        point of the cars."""
+        if car_ids is None:
+            car_ids = slice(None)
+        offset = np.stack([self.x[car_ids], self.y[car_ids]], axis=-1)
+        return self.ori_car_structure[self.ori_idx[car_ids]] + offset[:, None, :]
+
+    def get_points_vision(self, car_ids = None):
+        """Returns array of shape (len(car_ids), number_of_visions, 2, 2) with the
+        vision segments of the cars."""
+        if car_ids is None:
+            car_ids = slice(None)
+        offset = np.stack([self.x[car_ids], self.y[car_ids]], axis=-1)[:, None, :]
+        ends = self.ori_car_seg_vision[self.ori_idx[car_ids]] + offset
+        starts = np.broadcast_to(offset + self.center, ends.shape)
+        return np.ascontiguousarray(np.stack([starts, ends], axis=2))
+
+    def get_speed_squared(self, car_ids = None):
+        """Returns the speed of the cars in meters per second squared. Approximated
+        considering 120 FPS."""
+        if car_ids is None:
+            car_ids = slice(None)
+        return 120 * self.delta_pixels[car_ids]
+
+    def get_speed(self, car_ids = None):
+        """Returns the speed of the cars in meters per second. Approximated
+        considering 120 FPS."""
+        return np.sqrt(self.get_speed_squared(car_ids))
+
+    def get_angle(self, car_ids = None):
+        """Returns the angle of the speed vector of the cars in radians."""
+        if car_ids is None:
+            car_ids = slice(None)
+        angle = np.arctan2(self.direction[car_ids, 0], self.direction[car_ids, 1])
+        angle = np.where(angle < 0, 2*math.pi + angle, angle)
+        angle = angle - math.pi/2
+        return np.where(angle < 0, angle + 2*math.pi, angle)
+
+    def get_angle_degrees(self, car_ids = None):
+        """Returns the angle of the speed vector of the cars in degress."""
+        return self.get_angle(car_ids)*180/math.pi
@@ -0,0 +1,48 @@
+import os
+import json
+import queue
+import atexit
+import threading
+
+def write_json(obj, file_path : str):
+    """Writes obj as json in file_path atomically, the file is replaced only
+    when it's complete."""
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, file_path)
+
+class CheckpointWriter(object):
+    def __init__(self, queue_size : int):
+        """Runs saves in a background thread, in the order they're received.
+        At most queue_size saves wait to be written, submit blocks when the
+        queue is full. Pending saves are written when closed, or at exit."""
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.closed = False
+        atexit.register(self.close)
+
+    def run(self):
+        """Writes saves until None is received."""
+        while True:
+            task = self.queue.get()
+            if task == None:
+                return
+            function, args = task
+            try:
+                function(*args)
+            except Exception as e:
+                print("Unable to save checkpoint:", e)
+
+    def submit(self, function, *args):
+        """Calls function with args in the background. args must not be
+        changed after, they should be a snapshot of the data."""
+        self.queue.put((function, args))
+
+    def close(self):
+        """Waits for all pending saves."""
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
@@ -9,10 +9,16 @@ from shapely.geometry import Point
 from shapely.geometry import LineString
 
 import collisions_wrapper
+from circuit.wall_grid import WallGrid
+from circuit.distance_field import DistanceField
 
 class Circuit(object):
     COLLISION_NONE = 0
     COLLISION_WALL = 1
+    # Default side, in pixels, of the cells of the grid over the walls. The
+    # grid only culls walls, its results are the ones of testing every wall
+    # with the kernels, as orient/inDisk no longer round the points of the car
+    GRID_CELL_SIZE = 32
 
     def __init__(self, config, circuit_name):
         circuit_name = 'circuit_' + circuit_name
@@ -23,10 +29,11 @@ class Circuit(object):
         self.color_background = (255,255,255)
         self.color_wall = (0,0,0)
 
-        self.car_start_time = []
-        self.car_sectors = []
-        self.car_current_sector = []
-        self.car_start_frame = []
+        # Next sector line to be crossed by each car
+        self.car_current_sector = np.zeros(0, dtype=np.int64)
+        self.car_progress = np.zeros(0)
+        self.car_start_time = np.zeros(0)
+        self.car_start_frame = np.zeros(0, dtype=np.int64)
 
         self.x_shift = self.config['width']//3
         surface_dim = (2*config['width']//3, config['height'])
@@ -47,8 +54,43 @@ class Circuit(object):
         for sector_line in self.sectors:
             sector_line[0][0] += self.x_shift
             sector_line[1][0] += self.x_shift
-
-        self.point_max_sector = []
+        # Sector lines as array of shape (num_of_sectors, 2, 2), consecutive
+        # lines are the sides of the quads of the track.
+        self.sector_lines = np.array(self.sectors, dtype=np.float64)
+
+        # Threads used by the collision kernels, 0 uses all cores
+        threads = 0
+        if 'collisions' in config and 'threads' in config['collisions']:
+            threads = config['collisions']['threads']
+        collisions_wrapper.set_num_threads(threads)
+
+        # Optional culling of the walls by sector, each car is only tested
+        # against the walls its vision can reach from its sector.
+        self.use_sector_walls = False
+        if 'collisions' in config and 'sector_culling' in config['collisions']:
+            self.use_sector_walls = config['collisions']['sector_culling']
+
+        # Optional signed distance field, replaces the exact collision tests
+        # of the car bodies and vision by approximated ones.
+        self.use_distance_field = False
+        if 'collisions' in config and 'distance_field' in config['collisions']:
+            self.use_distance_field = config['collisions']['distance_field']
+        self.distance_field_resolution = 1
+        self.distance_field_tolerance = 0.5
+        self.distance_field_steps = 64
+        # Folder where the fields are saved, so they're built once per track
+        # and not in every run
+        self.distance_field_cache = None
+        if 'collisions' in config:
+            config_collisions = config['collisions']
+            if 'distance_field_resolution' in config_collisions:
+                self.distance_field_resolution = config_collisions['distance_field_resolution']
+            if 'distance_field_tolerance' in config_collisions:
+                self.distance_field_tolerance = config_collisions['distance_field_tolerance']
+            if 'distance_field_steps' in config_collisions:
+                self.distance_field_steps = config_collisions['distance_field_steps']
+            if 'distance_field_cache' in config_collisions:
+                self.distance_field_cache = config_collisions['distance_field_cache']
 
     def collision(self, shape):
         """Returns the type of collision of the shapely shape and the circuit.
@@ -59,19 +101,18 @@ class Circuit(object):
             points = shape
         c = Circuit.COLLISION_NONE
         wall = self.get_walls_list()
+        grid = self.get_walls_grid()
         j = 1
         while j < len(points):
             s1 = points[j - 1]
             s2 = points[j]
-            i = 0
-            while i < len(wall):
-                w1 = [wall[i], wall[i + 1]]
-                w2 = [wall[i + 2], wall[i + 3]]
+            for i in grid.walls_near_segment(s1, s2):
+                w1 = [wall[4*i], wall[4*i + 1]]
+                w2 = [wall[4*i + 2], wall[4*i + 3]]
                 inter, _ = self.seg_inter(s1, s2, w1, w2)
                 if inter:
                     c = Circuit.COLLISION_WALL
                     break
-                i += 4
             j += 1
         return c
 
@@ -140,14 +181,17 @@ class Circuit(object):
     def distance(self, segment):
         wall = self.get_walls_list()
         min_d = 1e9
-        i = 0
-        while i < len(wall):
-            w1 = [wall[i], wall[i + 1]]
-            w2 = [wall[i + 2], wall[i + 3]]
-            inter, pt = self.seg_inter(segment[0], segment[1], w1, w2)
-            if inter:
-                min_d = min(min_d, Point(pt).distance(Point(segment[0][0], segment[0][1])))
-            i += 4
+        # Walks the cells crossed by the segment, stopping in the first
+        # cell with a collision.
+        for walls_cell, d_exit in self.get_walls_grid().walk_segment(segment[0], segment[1]):
+            for i in walls_cell:
+                w1 = [wall[4*i], wall[4*i + 1]]
+                w2 = [wall[4*i + 2], wall[4*i + 3]]
+                inter, pt = self.seg_inter(segment[0], segment[1], w1, w2)
+                if inter:
+                    min_d = min(min_d, Point(pt).distance(Point(segment[0][0], segment[0][1])))
+            if min_d <= d_exit:
+                break
         return min_d
 
     def vector_magnitude_sum(self, vector, scalar):
@@ -194,8 +238,127 @@ class Circuit(object):
                         self.extend_seg(seg, 3)
                         self.walls.extend(seg)
                         last = [x, y]
+            self.walls_list = self.walls
         return self.walls
 
+    def get_walls_grid(self):
+        """Returns the WallGrid over the walls, built once per track."""
+        if not hasattr(self, "walls_grid"):
+            cell_size = Circuit.GRID_CELL_SIZE
+            if 'collisions' in self.config and 'grid_cell_size' in self.config['collisions']:
+                cell_size = self.config['collisions']['grid_cell_size']
+            self.walls_grid = WallGrid(self.get_walls_list(), cell_size)
+        return self.walls_grid
+
+    def get_distance_field(self):
+        """Returns the DistanceField of the walls, built once per track."""
+        if not hasattr(self, "distance_field"):
+            polygons = [[[x + self.x_shift, y] for x, y in points]
+                            for points in self.track_points if len(points) > 0]
+            self.distance_field = DistanceField.get(self.get_walls_list(), polygons,
+                                                    self.distance_field_resolution,
+                                                    self.distance_field_cache)
+        return self.distance_field
+
+    def get_sector_walls(self):
+        """Returns, for each value of car_current_sector, the walls that can
+        be touched or seen by a car in that sector, built once per track. A
+        car with current sector s is between the sector lines s-1 and s, the
+        quads before and after it are also considered, so cars slightly
+        behind or ahead of their sector are covered. Segments starting out
+        of these quads are tested with the grid (get_segs_outside). Returns
+        two arrays, walls of sector s are set_walls[set_start[s]:set_start[s+1]]."""
+        if not hasattr(self, "sector_walls"):
+            num_quads = self.num_of_sectors - 1
+            near = self.get_quads_walls_dist() <= self.get_sector_walls_reach()
+            sets = []
+            for sector in range(self.num_of_sectors + 1):
+                quads = [k % num_quads for k in range(sector - 2, sector + 1)]
+                sets.append(np.nonzero(near[quads].any(axis=0))[0])
+            set_start = np.zeros(len(sets) + 1, dtype=np.int32)
+            set_start[1:] = np.cumsum([len(x) for x in sets])
+            set_walls = np.concatenate(sets).astype(np.int32)
+            self.sector_walls = (set_start, set_walls)
+        return self.sector_walls
+
+    def get_sector_walls_reach(self):
+        """Returns the distance from its start at which a segment tested with
+        the walls of a sector can touch a wall, the length of the vision or
+        of a side of the car body, with one pixel of margin."""
+        config_car = self.config['car']
+        body_reach = math.hypot(config_car['car_width'], config_car['car_height'])
+        return max(config_car['vision_length'], body_reach) + 1
+
+    def get_quads(self):
+        """Returns array with shape (num_of_sectors - 1, 4, 2) with the corners
+        of the quads of the track, quad k is between the sector lines k and
+        k+1."""
+        if not hasattr(self, "quads"):
+            lines = self.sector_lines
+            self.quads = np.stack([lines[:-1, 0], lines[:-1, 1], lines[1:, 1], lines[1:, 0]], axis=1)
+        return self.quads
+
+    def points_in_quads(self, points, quads):
+        """Returns boolean array, True where the point is inside the quad.
+        points has shape (..., 2) and quads (..., 4, 2), broadcast."""
+        points = np.asarray(points, dtype=np.float64)
+        a = quads
+        b = np.roll(quads, -1, axis=-2)
+        px = points[..., None, 0]
+        py = points[..., None, 1]
+        crosses = (a[..., 1] > py) != (b[..., 1] > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_inter = a[..., 0] + (py - a[..., 1])*(b[..., 0] - a[..., 0])/(b[..., 1] - a[..., 1])
+        return (crosses & (px < x_inter)).sum(axis=-1)%2 == 1
+
+    def get_quads_walls_dist(self):
+        """Returns array with shape (num_of_sectors - 1, number of walls), the
+        distance between each quad and each wall, 0 if the wall touches or
+        is inside the quad."""
+        def dist_point_seg(p, a, b):
+            ab = b - a
+            len_sq = (ab*ab).sum(axis=-1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.where(len_sq > 0, ((p - a)*ab).sum(axis=-1)/len_sq, 0)
+            t = np.clip(t, 0, 1)[..., None]
+            return np.linalg.norm(a + t*ab - p, axis=-1)
+        walls = self.get_walls_array().astype(np.float64)
+        quads = self.get_quads()
+        # Edges of the quads, shape (quads, 4, 1, 2), and walls (1, 1, walls, 2)
+        a = quads[:, :, None]
+        b = np.roll(quads, -1, axis=1)[:, :, None]
+        c = walls[None, None, :, :2]
+        d = walls[None, None, :, 2:]
+        dist = np.minimum.reduce([dist_point_seg(c, a, b), dist_point_seg(d, a, b),
+                                    dist_point_seg(a, c, d), dist_point_seg(b, c, d)]).min(axis=1)
+        touch = self.batch_seg_inter(a, b, c, d).any(axis=1) | \
+                    self.points_in_quads(walls[None, :, :2], quads[:, None])
+        return np.where(touch, 0, dist)
+
+    def get_segs_outside(self, segs, segs_sector):
+        """Returns indexes of the segments starting out of the quads covered
+        by the walls of their sector, they can touch walls not in its set.
+        It happens to cars that drive backwards, their sector never goes
+        down."""
+        quads = self.get_quads()
+        ids = (np.asarray(segs_sector, dtype=np.int64)[:, None] + np.arange(-2, 1))%len(quads)
+        inside = self.points_in_quads(segs[:, None, :2], quads[ids]).any(axis=1)
+        return np.nonzero(~inside)[0]
+
+    def get_segs_sector(self, car_ids, n_segs):
+        """Returns int32 array with the current sector of the car of each of
+        the n_segs segments, split evenly between the cars in car_ids."""
+        sectors = self.car_current_sector[np.asarray(car_ids, dtype=np.int64)]
+        return np.repeat(sectors, n_segs//len(sectors)).astype(np.int32)
+
+    def get_walls_array(self):
+        """Returns the walls as a float32 array with shape (n, 4), converted
+        once per track to be passed to the collision kernels."""
+        if not hasattr(self, "walls_array"):
+            self.walls_array = self.as_segs_array(self.get_walls_list())
+            self.walls_array.flags.writeable = False
+        return self.walls_array
+
     def draw(self):
         """Returns the pygame.Surface with the track drawed"""
         self.surface.set_colorkey((0, 255, 0))
@@ -212,28 +375,29 @@ class Circuit(object):
 
     def add_car(self, player, frame_now):
         """Adds a car in the circuit."""
-        id = len(self.car_sectors)
-        self.car_sectors.append([0 for i in range(self.num_of_sectors)])
-        self.car_sectors[id][0] = 1
-        self.car_current_sector.append(0)
-        self.car_start_time.append(time.time())
-        self.car_start_frame.append(frame_now)
-        self.point_max_sector.append(self.num_of_sectors - 1)
+        return int(self.add_cars(1, frame_now)[0])
+
+    def add_cars(self, n, frame_now):
+        """Adds n cars in the circuit, returns array with their ids."""
+        first = len(self.car_current_sector)
+        self.car_current_sector = np.concatenate([self.car_current_sector, np.zeros(n, dtype=np.int64)])
+        self.car_progress = np.concatenate([self.car_progress, np.zeros(n)])
+        self.car_start_time = np.concatenate([self.car_start_time, np.full(n, time.time())])
+        self.car_start_frame = np.concatenate([self.car_start_frame, np.full(n, frame_now, dtype=np.int64)])
 
-        return id
+        return np.arange(first, first + n)
 
     def reset(self, car_id, frame_now):
-        """Reset car with car_id."""
-        self.car_sectors[car_id] = [0 for i in range(self.num_of_sectors)]
-        self.car_sectors[car_id][0] = 1
+        """Reset car with car_id, it can also be an array of ids."""
         self.car_current_sector[car_id] = 0
+        self.car_progress[car_id] = 0
         self.car_start_time[car_id] = time.time()
         self.car_start_frame[car_id] = frame_now
-        self.point_max_sector[car_id] = self.num_of_sectors - 1
 
     def finished(self, car_id):
-        """True if the car finished the circuit, False otherwise."""
-        return sum(self.car_sectors[car_id]) == self.num_of_sectors
+        """True if the car finished the circuit, False otherwise. With an
+        array of ids, returns a boolean array."""
+        return self.car_current_sector[car_id] == self.num_of_sectors
 
     def collision_car(self, car):
         """Returns the type of collision of the car and the circuit. Can be
@@ -243,116 +407,225 @@ class Circuit(object):
     def batch_collision_car(self, list_cars):
         """Returns a list of types of collisions, each position corresponding
         to each car in list_cars."""
-        if collisions_wrapper.collisions:
-            ret = []
-            segs = []
-            for car in list_cars:
-                pts = car.get_points()
-                last_x, last_y = pts[-1]
-                for x, y in pts:
-                    segs.extend([last_x, last_y, x, y])
-                    last_x, last_y = x, y
-            batch_ret = self.batch_collision_segs(segs, self.get_walls_list())
-            for i in range(0, 4*len(list_cars), 4):
-                now = Circuit.COLLISION_NONE
-                for j in range(i, i+4):
-                    if batch_ret[j]:
-                        now = Circuit.COLLISION_WALL
-                        break
-                ret.append(now)
-
-            assert(len(ret) == len(list_cars))
-            # Free memory
-            collisions_wrapper.freeme(batch_ret)
-            return ret
+        return self.batch_collision_points([car.get_points() for car in list_cars])
+
+    def batch_collision_points(self, list_points, car_ids = None):
+        """Returns an array of types of collisions, each position corresponding
+        to each car body in list_points. Each car body is a list of 4 points,
+        list_points can also be an array of shape (n, 4, 2). If the ids of
+        the cars are received, each body may be tested only against the
+        walls near the sector of its car."""
+        if self.use_distance_field:
+            batch_ret = self.get_distance_field().collision(list_points, self.distance_field_tolerance)
+            return np.where(batch_ret, Circuit.COLLISION_WALL, Circuit.COLLISION_NONE)
+        pts = np.asarray(list_points, dtype=np.float32).reshape(-1, 4, 2)
+        # Segment k of each body goes from point k-1 to point k
+        segs = np.empty((len(pts), 4, 4), dtype=np.float32)
+        segs[:, :, :2] = np.roll(pts, 1, axis=1)
+        segs[:, :, 2:] = pts
+        out = self.get_buffer('col_body', 4*len(pts), np.int32)
+        if self.use_sector_walls and car_ids is not None and len(pts):
+            batch_ret = self.batch_collision_sector_segs(segs, self.get_segs_sector(car_ids, 4*len(pts)), out)
         else:
-            return [self.collision_car(car) for car in list_cars]
+            batch_ret = self.batch_collision_walls_segs(segs, out)
+        return np.where(batch_ret.reshape(-1, 4).any(axis=1),
+                        Circuit.COLLISION_WALL, Circuit.COLLISION_NONE)
 
     def batch_collision(self, segs_input : list):
         """Returns a list of types of collisions, each position corresponding
         to the collision with the walls for each segment.
-        segs is expected to be a list of elements in the format: [[x1, y1], [x2, y2]]"""
-        if collisions_wrapper.collisions:
-            ret = []
-            segs_list = []
-            for seg in segs_input:
-                segs_list.extend([seg[0][0], seg[0][1], seg[1][0], seg[1][1]])
-            batch_ret = self.batch_collision_segs(segs_list, self.get_walls_list())
-            for i in range(len(segs_input)):
-                if batch_ret[i]:
-                    ret.append(Circuit.COLLISION_WALL)
-                else:
-                    ret.append(Circuit.COLLISION_NONE)
-
-            assert(len(ret) == len(segs_input))
-            # Free memory
-            collisions_wrapper.freeme(batch_ret)
-            return ret
-        else:
-            return [self.collision(shape) for shape in segs_input]
-
-    def batch_collision_segs(self, segs_1, segs_2):
-        """Receives two lists of segments and compute which of the first
-        collide with any of the second."""
-        n_segs_1 = len(segs_1)
-        n_segs_2 = len(segs_2)
-        segs_1 = (ctypes.c_float * n_segs_1)(*segs_1)
-        segs_2 = (ctypes.c_float * n_segs_2)(*segs_2)
-        n_segs_1//=4
-        n_segs_2//=4
-        return collisions_wrapper.col_circuit(segs_1, n_segs_1, segs_2, n_segs_2)
-
-    def batch_collision_dist(self, segs_input : list):
+        segs is expected to be a list of elements in the format: [[x1, y1], [x2, y2]]
+        or an array of shape (n, 2, 2)."""
+        segs = self.as_segs_array(segs_input)
+        batch_ret = self.batch_collision_walls_segs(segs,
+                        self.get_buffer('col_segs', len(segs), np.int32))
+        return np.where(batch_ret, Circuit.COLLISION_WALL, Circuit.COLLISION_NONE)
+
+    def get_buffer(self, name, size, dtype):
+        """Returns an array with size positions owned by the circuit, reused
+        between calls with the same name, so results of the collision
+        kernels don't need new allocations every frame."""
+        if not hasattr(self, "buffers"):
+            self.buffers = {}
+        if name not in self.buffers or len(self.buffers[name]) < size:
+            self.buffers[name] = np.empty(size, dtype=dtype)
+        return self.buffers[name][:size]
+
+    def as_segs_array(self, segs):
+        """Returns segs as a contiguous float32 array with 4 floats for each
+        segment. Arrays (or buffers) with float32 are not copied."""
+        return np.ascontiguousarray(np.asarray(segs, dtype=np.float32).reshape(-1, 4))
+
+    def get_out_array(self, out, size, dtype):
+        """Returns out, checking it can receive size results of type dtype,
+        or a new array if out is None."""
+        if out is None:
+            return np.empty(size, dtype=dtype)
+        if out.dtype != dtype or len(out) != size or not out.flags.c_contiguous:
+            raise ValueError("out must be a contiguous %s array with %d positions" % (np.dtype(dtype), size))
+        return out
+
+    def batch_collision_segs(self, segs_1, segs_2, out = None):
+        """Receives two arrays (or lists) of segments, 4 floats for each,
+        and compute which of the first collide with any of the second. The
+        result is written in out, an int32 array, if it's received."""
+        segs_1 = self.as_segs_array(segs_1)
+        segs_2 = self.as_segs_array(segs_2)
+        out = self.get_out_array(out, len(segs_1), np.int32)
+        collisions_wrapper.col_circuit(segs_1, len(segs_1), segs_2, len(segs_2), out)
+        return out
+
+    def batch_collision_walls_segs(self, segs, out = None):
+        """Receives array (or list) of segments, 4 floats for each, and
+        compute which of them collide with the walls, using the uniform grid
+        over the walls. The result is written in out, an int32 array, if
+        it's received."""
+        grid = self.get_walls_grid()
+        segs = self.as_segs_array(segs)
+        out = self.get_out_array(out, len(segs), np.int32)
+        collisions_wrapper.col_circuit_grid(segs, len(segs), self.get_walls_array(),
+            grid.cell_start, grid.cell_walls, grid.x0, grid.y0, grid.cell_size,
+            grid.nx, grid.ny, out)
+        return out
+
+    def batch_collision_sector_segs(self, segs, segs_sector, out = None):
+        """Receives array (or list) of segments, 4 floats for each, and the
+        sector of each one. Compute which of them collide with the walls of
+        their sector, or with the grid if they start out of its quads. The
+        result is written in out, an int32 array, if it's received."""
+        set_start, set_walls = self.get_sector_walls()
+        segs = self.as_segs_array(segs)
+        out = self.get_out_array(out, len(segs), np.int32)
+        collisions_wrapper.col_circuit_sets(segs, len(segs), segs_sector,
+            self.get_walls_array(), set_start, set_walls, out)
+        outside = self.get_segs_outside(segs, segs_sector)
+        if len(outside):
+            out[outside] = self.batch_collision_walls_segs(segs[outside])
+        return out
+
+    def batch_collision_dist(self, segs_input : list, car_ids = None):
         """Returns a list of distance to the first collision, each position corresponding
         to the collision with the walls for each segment.
-        segs is expected to be a list of elements in the format: [[x1, y1], [x2, y2]]"""
-        if collisions_wrapper.collisions:
-            ret = []
-            segs_list = []
-            for seg in segs_input:
-                segs_list.extend([seg[0][0], seg[0][1], seg[1][0], seg[1][1]])
-            batch_ret = self.batch_collision_dist_segs(segs_list, self.get_walls_list())
-            for i in range(len(segs_input)):
-                ret.append(batch_ret[i])
-
-            # Free memory
-            collisions_wrapper.freeme(batch_ret)
-            return ret
-        else:
-            return [self.distance(shape) for shape in segs_input]
-
-    def batch_collision_dist_segs(self, segs_1, segs_2):
-        """Receives two lists of segments. Returns the distance between
-        each segment in segs_1 to the first segment collision in segs_2."""
-        n_segs_1 = len(segs_1)
-        n_segs_2 = len(segs_2)
-        segs_1 = (ctypes.c_float * n_segs_1)(*segs_1)
-        segs_2 = (ctypes.c_float * n_segs_2)(*segs_2)
-        n_segs_1 //= 4
-        n_segs_2 //= 4
-        return collisions_wrapper.col_dist_circuit(segs_1, n_segs_1, segs_2, n_segs_2)
+        segs is expected to be a list of elements in the format: [[x1, y1], [x2, y2]]
+        or an array of shape (n, 2, 2). If the ids of the cars are received,
+        the segments are split evenly between them and each segment may be
+        tested only against the walls reachable from the sector of its car."""
+        segs = self.as_segs_array(segs_input)
+        if self.use_distance_field:
+            return self.get_distance_field().distance(segs, self.distance_field_tolerance,
+                                                        self.distance_field_steps)
+        out = self.get_buffer('col_dist', len(segs), np.float32)
+        if self.use_sector_walls and car_ids is not None and len(segs):
+            return self.batch_collision_dist_sector_segs(segs, self.get_segs_sector(car_ids, len(segs)), out)
+        return self.batch_collision_dist_walls_segs(segs, out)
+
+    def batch_collision_dist_segs(self, segs_1, segs_2, out = None):
+        """Receives two arrays (or lists) of segments, 4 floats for each.
+        Returns the distance between each segment in segs_1 to the first
+        segment collision in segs_2. The result is written in out, a float32
+        array, if it's received."""
+        segs_1 = self.as_segs_array(segs_1)
+        segs_2 = self.as_segs_array(segs_2)
+        out = self.get_out_array(out, len(segs_1), np.float32)
+        collisions_wrapper.col_dist_circuit(segs_1, len(segs_1), segs_2, len(segs_2), out)
+        return out
+
+    def batch_collision_dist_walls_segs(self, segs, out = None):
+        """Receives array (or list) of segments, 4 floats for each. Returns
+        the distance between each segment to the first collision with the
+        walls, walking the uniform grid over the walls. The result is written
+        in out, a float32 array, if it's received."""
+        grid = self.get_walls_grid()
+        segs = self.as_segs_array(segs)
+        out = self.get_out_array(out, len(segs), np.float32)
+        collisions_wrapper.col_dist_circuit_grid(segs, len(segs), self.get_walls_array(),
+            grid.cell_start, grid.cell_walls, grid.x0, grid.y0, grid.cell_size,
+            grid.nx, grid.ny, out)
+        return out
+
+    def batch_collision_dist_sector_segs(self, segs, segs_sector, out = None):
+        """Receives array (or list) of segments, 4 floats for each, and the
+        sector of each one. Returns the distance between each segment to the
+        first collision with the walls of its sector, or with the grid if it
+        starts out of its quads. The result is written in out, a float32
+        array, if it's received."""
+        set_start, set_walls = self.get_sector_walls()
+        segs = self.as_segs_array(segs)
+        out = self.get_out_array(out, len(segs), np.float32)
+        collisions_wrapper.col_dist_circuit_sets(segs, len(segs), segs_sector,
+            self.get_walls_array(), set_start, set_walls, out)
+        outside = self.get_segs_outside(segs, segs_sector)
+        if len(outside):
+            out[outside] = self.batch_collision_dist_walls_segs(segs[outside])
+        return out
 
     def update_car_sector(self, car_id, car):
         """Updates the sector of the car."""
-        now = self.car_current_sector[car_id]
-        segs = []
-        pts = car.get_points()
-        last_x, last_y = pts[-1]
-        for x, y in pts:
-            segs.append([[last_x, last_y], [x, y]])
-            last_x, last_y = x, y
-        nxt_sector = True
-        while nxt_sector and now < self.num_of_sectors:
-            nxt_sector = False
-            for s1, s2 in segs:
-                if self.seg_inter(self.sectors[now][0], self.sectors[now][1], s1, s2)[0]:
-                    nxt_sector = True
-                    break
-            if nxt_sector:
-                self.car_sectors[car_id][now] = 1
-                now += 1
-
-        self.car_current_sector[car_id] = now
+        self.update_cars_sector(np.array([car_id]), np.array([car.get_points()]))
+
+    def batch_seg_inter(self, a, b, c, d):
+        """Same test as seg_inter, for arrays of points with shape (..., 2).
+        Returns boolean array, True where segment (a, b) intersects (c, d)."""
+        def cross(v, w):
+            return v[..., 0]*w[..., 1] - v[..., 1]*w[..., 0]
+        def dot(v, w):
+            return v[..., 0]*w[..., 0] + v[..., 1]*w[..., 1]
+        oa = cross(c - a, d - a)
+        ob = cross(c - b, d - b)
+        oc = cross(a - c, b - c)
+        od = cross(a - d, b - d)
+        proper = (oa*ob < 0) & (oc*od < 0)
+        on_segment = ((oa == 0) & (dot(c - a, d - a) <= 0)) | \
+                        ((ob == 0) & (dot(c - b, d - b) <= 0)) | \
+                        ((oc == 0) & (dot(a - c, b - c) <= 0)) | \
+                        ((od == 0) & (dot(a - d, b - d) <= 0))
+        return proper | on_segment
+
+    def update_cars_sector(self, car_ids, points):
+        """Updates the sector of the cars with car_ids, receives array of
+        shape (len(car_ids), 4, 2) with the points of their bodies. Every car
+        is tested against its next sector line at once, cars that cross it
+        are tested again against the following one."""
+        car_ids = np.asarray(car_ids, dtype=np.int64)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 4, 2)
+        # Segment k of each body goes from point k-1 to point k
+        body_a = np.roll(points, 1, axis=1)
+        body_b = points
+        idx = np.arange(len(car_ids))
+        while True:
+            now = self.car_current_sector[car_ids[idx]]
+            running = now < self.num_of_sectors
+            idx, now = idx[running], now[running]
+            if len(idx) == 0:
+                break
+            lines = self.sector_lines[now]
+            crossed = self.batch_seg_inter(lines[:, None, 0], lines[:, None, 1],
+                                            body_a[idx], body_b[idx]).any(axis=1)
+            idx = idx[crossed]
+            self.car_current_sector[car_ids[idx]] += 1
+
+        # Continuous progress, the car is between the last crossed line
+        # and the next one.
+        now = self.car_current_sector[car_ids]
+        progress = np.where(now >= self.num_of_sectors, self.num_of_sectors - 1, 0).astype(np.float64)
+        inside = (now > 0) & (now < self.num_of_sectors)
+        if inside.any():
+            center = points[inside].mean(axis=1)
+            d_last = self.dist_to_sector_lines(center, now[inside] - 1)
+            d_next = self.dist_to_sector_lines(center, now[inside])
+            total = d_last + d_next
+            frac = np.divide(d_last, total, out=np.zeros_like(total), where=total > 0)
+            progress[inside] = now[inside] - 1 + frac
+        self.car_progress[car_ids] = progress/(self.num_of_sectors - 1)
+
+    def dist_to_sector_lines(self, p, lines_idx):
+        """Returns distance from each point in p, array of shape (n, 2), to
+        the sector line with index in lines_idx."""
+        a = self.sector_lines[lines_idx, 0]
+        u = self.sector_lines[lines_idx, 1] - a
+        len_sq = (u*u).sum(axis=1)
+        t = np.clip(((p - a)*u).sum(axis=1)/np.maximum(len_sq, 1e-12), 0, 1)
+        return np.linalg.norm(a + t[:, None]*u - p, axis=1)
 
     def get_points_shape(self, shape):
         """Receives any shapely shape and returns it points in a array"""
@@ -371,5 +644,11 @@ class Circuit(object):
         return frame_now - self.car_start_frame[car_id]
 
     def get_car_perc_sectors(self, car_id):
-        """Returns percentage of sectors already traversed by car with car_id."""
-        return sum(self.car_sectors[car_id])/self.num_of_sectors
\ No newline at end of file
+        """Returns percentage of sectors already traversed by car with car_id.
+        The first sector always counts as traversed."""
+        return np.maximum(self.car_current_sector[car_id], 1)/self.num_of_sectors
+
+    def get_car_progress(self, car_id):
+        """Returns continuous progress of car with car_id along the track,
+        from 0 in the start line to 1 in the finish line."""
+        return self.car_progress[car_id]
\ No newline at end of file
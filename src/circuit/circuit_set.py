@@ -0,0 +1,101 @@
+import numpy as np
+
+from circuit.circuit import Circuit
+
+class CircuitSet(object):
+    def __init__(self, config, circuit_names : list, cars_per_circuit : int):
+        """Circuits in which the same population is evaluated at once, with
+        the batched interface of Circuit used by ControllerAI. Car ids are
+        global, the cars of the circuit k have ids from k*cars_per_circuit
+        to (k+1)*cars_per_circuit - 1, and each circuit only receives its
+        cars. The first circuit is the one drawn."""
+        self.circuits = [Circuit(config, x) for x in circuit_names]
+        self.cars_per_circuit = cars_per_circuit
+        self.start = self.circuits[0].start
+        self.start_angle = self.circuits[0].start_angle
+
+    def get_circuit(self, car_id):
+        """Returns the circuit of car_id and the id of the car in it."""
+        return self.circuits[car_id//self.cars_per_circuit], car_id%self.cars_per_circuit
+
+    def split(self, car_ids):
+        """Yields each circuit with cars in car_ids, the positions of its cars
+        in car_ids and their ids in the circuit."""
+        car_ids = np.asarray(car_ids, dtype=np.int64)
+        circuit_of_car = car_ids//self.cars_per_circuit
+        for k, circuit in enumerate(self.circuits):
+            pos = np.nonzero(circuit_of_car == k)[0]
+            if len(pos):
+                yield circuit, pos, car_ids[pos] - k*self.cars_per_circuit
+
+    def draw(self):
+        """Returns the pygame.Surface with the first circuit drawed."""
+        return self.circuits[0].draw()
+
+    def add_cars(self, n, frame_now):
+        """Adds n cars, split evenly between the circuits, returns array with
+        their ids."""
+        for circuit in self.circuits:
+            circuit.add_cars(n//len(self.circuits), frame_now)
+        return np.arange(n)
+
+    def reset(self, car_id, frame_now):
+        """Reset car with car_id, it can also be an array of ids."""
+        for circuit, _, ids in self.split(np.atleast_1d(car_id)):
+            circuit.reset(ids, frame_now)
+
+    def finished(self, car_id):
+        """True if the car finished its circuit, False otherwise. With an
+        array of ids, returns a boolean array."""
+        if np.ndim(car_id) == 0:
+            circuit, car_id = self.get_circuit(car_id)
+            return circuit.finished(car_id)
+        ret = np.zeros(len(car_id), dtype=bool)
+        for circuit, pos, ids in self.split(car_id):
+            ret[pos] = circuit.finished(ids)
+        return ret
+
+    def batch_collision_points(self, list_points, car_ids):
+        """Returns an array of types of collisions of each car body in
+        list_points, array of shape (len(car_ids), 4, 2), with its circuit."""
+        points = np.asarray(list_points).reshape(-1, 4, 2)
+        ret = np.empty(len(points), dtype=np.int64)
+        for circuit, pos, ids in self.split(car_ids):
+            ret[pos] = circuit.batch_collision_points(points[pos], ids)
+        return ret
+
+    def batch_collision_dist(self, segs_input, car_ids):
+        """Returns array with the distance to the first collision of each
+        segment, split evenly between the cars in car_ids, with the walls
+        of the circuit of its car."""
+        if len(car_ids) == 0:
+            return np.empty(0, dtype=np.float32)
+        segs = np.asarray(segs_input, dtype=np.float32).reshape(len(car_ids), -1, 4)
+        ret = np.empty(segs.shape[:2], dtype=np.float32)
+        for circuit, pos, ids in self.split(car_ids):
+            ret[pos] = circuit.batch_collision_dist(segs[pos], ids).reshape(len(pos), -1)
+        return ret.reshape(-1)
+
+    def update_cars_sector(self, car_ids, points):
+        """Updates the sector of the cars with car_ids in their circuits."""
+        points = np.asarray(points).reshape(-1, 4, 2)
+        for circuit, pos, ids in self.split(car_ids):
+            circuit.update_cars_sector(ids, points[pos])
+
+    def get_car_num_frames(self, car_id, frame_now):
+        """Returns number of frames since the car was added."""
+        circuit, car_id = self.get_circuit(car_id)
+        return circuit.get_car_num_frames(car_id, frame_now)
+
+    def get_car_perc_sectors(self, car_id):
+        """Returns percentage of sectors of its circuit traversed by the car."""
+        circuit, car_id = self.get_circuit(car_id)
+        return circuit.get_car_perc_sectors(car_id)
+
+    def get_car_progress(self, car_ids):
+        """Returns array with the continuous progress of each car in car_ids
+        along its circuit, from 0 to 1."""
+        ret = np.empty(len(car_ids))
+        for circuit, pos, ids in self.split(car_ids):
+            ret[pos] = circuit.get_car_progress(ids)
+        return ret
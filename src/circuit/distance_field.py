@@ -0,0 +1,155 @@
+import os
+import hashlib
+import numpy as np
+
+class DistanceField(object):
+    # Fields already built, by walls and resolution
+    cache = {}
+
+    def __init__(self, walls, polygons, resolution : float):
+        """Signed distance field of the walls sampled in a grid with
+        resolution pixels between samples. walls is a list of floats, each 4
+        positions representing a segment (as Circuit.get_walls_list), and
+        polygons the closed lines of the walls. The distance is positive
+        inside the track (inside an odd number of polygons) and negative
+        outside."""
+        self.resolution = float(resolution)
+        walls = np.asarray(walls, dtype=np.float64).reshape(-1, 4)
+        margin = 4*self.resolution
+        self.x0 = walls[:, [0, 2]].min() - margin
+        self.y0 = walls[:, [1, 3]].min() - margin
+        self.nx = int(np.ceil((walls[:, [0, 2]].max() + margin - self.x0)/self.resolution)) + 1
+        self.ny = int(np.ceil((walls[:, [1, 3]].max() + margin - self.y0)/self.resolution)) + 1
+
+        px = self.x0 + self.resolution*np.arange(self.nx)
+        py = self.y0 + self.resolution*np.arange(self.ny)
+        px, py = np.meshgrid(px, py)
+        px = px.ravel()
+        py = py.ravel()
+
+        # Unsigned distance to the closest wall
+        dist_sq = np.full(len(px), np.inf)
+        for cx, cy, dx, dy in walls:
+            ux, uy = dx - cx, dy - cy
+            len_sq = ux*ux + uy*uy
+            if len_sq > 0:
+                t = np.clip(((px - cx)*ux + (py - cy)*uy)/len_sq, 0, 1)
+            else:
+                t = 0
+            qx = cx + t*ux - px
+            qy = cy + t*uy - py
+            np.minimum(dist_sq, qx*qx + qy*qy, out=dist_sq)
+
+        # Crossing number to know which points are inside the track
+        inside = np.zeros(len(px), dtype=bool)
+        for polygon in polygons:
+            polygon = np.asarray(polygon, dtype=np.float64)
+            for (ax, ay), (bx, by) in zip(polygon, np.roll(polygon, -1, axis=0)):
+                if ay == by:
+                    continue
+                crosses = (ay > py) != (by > py)
+                x_inter = ax + (py - ay)*(bx - ax)/(by - ay)
+                inside ^= crosses & (px < x_inter)
+
+        self.field = np.where(inside, 1, -1)*np.sqrt(dist_sq)
+        self.field = self.field.reshape(self.ny, self.nx)
+        self.field.flags.writeable = False
+
+    @classmethod
+    def get(cls, walls, polygons, resolution : float, folder_path = None):
+        """Returns the DistanceField of the walls, built only once for the
+        same walls and resolution. If folder_path is received, the field is
+        also saved there and loaded back by the next runs."""
+        key = hashlib.sha1(np.asarray(walls, dtype=np.float64).tobytes()).hexdigest(), float(resolution)
+        if key not in cls.cache:
+            file_path = None
+            if folder_path:
+                file_path = os.path.join(folder_path, "sdf_%s_%g.npz" % key)
+            if file_path and os.path.exists(file_path):
+                cls.cache[key] = cls.load(file_path)
+            else:
+                cls.cache[key] = cls(walls, polygons, resolution)
+                if file_path:
+                    cls.cache[key].save(file_path)
+        return cls.cache[key]
+
+    @classmethod
+    def load(cls, file_path : str):
+        """Returns the DistanceField saved in file_path."""
+        ret = cls.__new__(cls)
+        with np.load(file_path) as data:
+            ret.resolution = float(data['resolution'])
+            ret.x0 = float(data['x0'])
+            ret.y0 = float(data['y0'])
+            ret.field = data['field']
+        ret.ny, ret.nx = ret.field.shape
+        ret.field.flags.writeable = False
+        return ret
+
+    def save(self, file_path : str):
+        """Saves the field in file_path, replacing it only when complete."""
+        folder_path = os.path.dirname(file_path)
+        if folder_path and not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, resolution=self.resolution, x0=self.x0, y0=self.y0, field=self.field)
+        os.replace(tmp_path, file_path)
+
+    def sample(self, x, y):
+        """Returns the signed distance in the points (x, y), arrays with any
+        shape, interpolated from the grid. Points outside the grid use the
+        closest border of the grid."""
+        gx = np.clip((np.asarray(x) - self.x0)/self.resolution, 0, self.nx - 1.001)
+        gy = np.clip((np.asarray(y) - self.y0)/self.resolution, 0, self.ny - 1.001)
+        ix = gx.astype(np.int64)
+        iy = gy.astype(np.int64)
+        fx = gx - ix
+        fy = gy - iy
+        f = self.field
+        top = f[iy, ix]*(1 - fx) + f[iy, ix + 1]*fx
+        bottom = f[iy + 1, ix]*(1 - fx) + f[iy + 1, ix + 1]*fx
+        return top*(1 - fy) + bottom*fy
+
+    def collision(self, bodies, tolerance : float):
+        """Receives array of shape (n, k, 2) with the points of n closed
+        polygons. Returns boolean array, True for the polygons with a point
+        or middle point of an edge closer than tolerance to a wall or
+        outside the track."""
+        bodies = np.asarray(bodies, dtype=np.float64)
+        middle = (bodies + np.roll(bodies, 1, axis=1))/2
+        samples = np.concatenate([bodies, middle], axis=1)
+        return (self.sample(samples[..., 0], samples[..., 1]) < tolerance).any(axis=1)
+
+    def distance(self, segs, tolerance : float, max_steps : int):
+        """Receives array of shape (n, 4) with segments. Returns the distance
+        from the start of each segment to the first wall found by sphere
+        tracing along it, 1e9 if the segment ends before a wall. The
+        number of steps doesn't depend on the number of walls."""
+        segs = np.asarray(segs, dtype=np.float64).reshape(-1, 4)
+        ax, ay = segs[:, 0], segs[:, 1]
+        dx = segs[:, 2] - ax
+        dy = segs[:, 3] - ay
+        length = np.hypot(dx, dy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dx = np.where(length > 0, dx/length, 0)
+            dy = np.where(length > 0, dy/length, 0)
+
+        t = np.zeros(len(segs))
+        running = np.arange(len(segs))
+        hit = np.zeros(len(segs), dtype=bool)
+        # Minimum step, so rays parallel to a wall still advance
+        min_step = self.resolution/2
+        for i in range(max_steps):
+            if len(running) == 0:
+                break
+            tr = t[running]
+            d = self.sample(ax[running] + tr*dx[running], ay[running] + tr*dy[running])
+            now_hit = d < tolerance
+            hit[running[now_hit]] = True
+            t[running] = np.where(now_hit, tr, tr + np.maximum(d, min_step))
+            running = running[~now_hit & (t[running] < length[running])]
+        # Rays that ran out of steps are considered blocked where they are
+        hit[running] = True
+        t = np.minimum(t, length)
+        return np.where(hit, t, 1e9)
@@ -0,0 +1,113 @@
+import math
+import numpy as np
+
+class WallGrid(object):
+    def __init__(self, walls : list, cell_size : float):
+        """Uniform grid over the walls, receives list of floats, each 4
+        positions representing a segment (as Circuit.get_walls_list). Each
+        cell keeps the indexes of the walls whose bounding box overlap it."""
+        self.cell_size = float(cell_size)
+        walls = np.asarray(walls, dtype=np.float64).reshape(-1, 4)
+        self.n_walls = len(walls)
+        min_x = np.minimum(walls[:, 0], walls[:, 2])
+        max_x = np.maximum(walls[:, 0], walls[:, 2])
+        min_y = np.minimum(walls[:, 1], walls[:, 3])
+        max_y = np.maximum(walls[:, 1], walls[:, 3])
+
+        # One cell of margin, so segments touching the border are inside
+        self.x0 = math.floor(min_x.min()) - self.cell_size
+        self.y0 = math.floor(min_y.min()) - self.cell_size
+        self.nx = int(math.ceil((max_x.max() - self.x0)/self.cell_size)) + 1
+        self.ny = int(math.ceil((max_y.max() - self.y0)/self.cell_size)) + 1
+
+        # Small padding, so points in the border of a cell are in both cells
+        pad = 1e-3*self.cell_size
+        cx_1 = self.cell_x(min_x - pad)
+        cx_2 = self.cell_x(max_x + pad)
+        cy_1 = self.cell_y(min_y - pad)
+        cy_2 = self.cell_y(max_y + pad)
+        cells = [[] for i in range(self.nx*self.ny)]
+        for i in range(self.n_walls):
+            for cy in range(cy_1[i], cy_2[i] + 1):
+                for cx in range(cx_1[i], cx_2[i] + 1):
+                    cells[cy*self.nx + cx].append(i)
+
+        # Compressed representation, walls of cell c are
+        # cell_walls[cell_start[c]:cell_start[c+1]]
+        self.cell_start = np.zeros(len(cells) + 1, dtype=np.int32)
+        self.cell_start[1:] = np.cumsum([len(x) for x in cells])
+        self.cell_walls = np.array([i for x in cells for i in x], dtype=np.int32)
+
+    def cell_x(self, x):
+        """Returns column of the cell with x, clamped to the grid."""
+        return np.clip(np.floor((np.asarray(x) - self.x0)/self.cell_size), 0, self.nx - 1).astype(np.int64)
+
+    def cell_y(self, y):
+        """Returns row of the cell with y, clamped to the grid."""
+        return np.clip(np.floor((np.asarray(y) - self.y0)/self.cell_size), 0, self.ny - 1).astype(np.int64)
+
+    def cell_walls_list(self, cx, cy):
+        """Returns array with indexes of the walls in cell (cx, cy)."""
+        c = cy*self.nx + cx
+        return self.cell_walls[self.cell_start[c]:self.cell_start[c+1]]
+
+    def walls_near_segment(self, a, b):
+        """Returns array with indexes of the walls in the cells overlapped by
+        the bounding box of segment (a, b), without repetitions."""
+        cx_1, cx_2 = self.cell_x(min(a[0], b[0])), self.cell_x(max(a[0], b[0]))
+        cy_1, cy_2 = self.cell_y(min(a[1], b[1])), self.cell_y(max(a[1], b[1]))
+        ret = [self.cell_walls_list(cx, cy)
+                for cy in range(cy_1, cy_2 + 1) for cx in range(cx_1, cx_2 + 1)]
+        return np.unique(np.concatenate(ret))
+
+    def walk_segment(self, a, b):
+        """Walks the cells crossed by segment (a, b) in order (DDA). Yields
+        for each cell the array of indexes of its walls and the distance from
+        a in which the segment leaves the cell."""
+        dx = b[0] - a[0]
+        dy = b[1] - a[1]
+        length = math.sqrt(dx*dx + dy*dy)
+
+        # Clip segment to the grid
+        t_0, t_1 = 0.0, 1.0
+        limits = [(a[0], dx, self.x0, self.x0 + self.nx*self.cell_size),
+                    (a[1], dy, self.y0, self.y0 + self.ny*self.cell_size)]
+        for p, d, lo, hi in limits:
+            if d == 0:
+                if p < lo or p > hi:
+                    return
+            else:
+                t_lo, t_hi = sorted(((lo - p)/d, (hi - p)/d))
+                t_0 = max(t_0, t_lo)
+                t_1 = min(t_1, t_hi)
+        if t_0 > t_1:
+            return
+
+        cx = int(self.cell_x(a[0] + t_0*dx))
+        cy = int(self.cell_y(a[1] + t_0*dy))
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        if dx != 0:
+            t_max_x = (self.x0 + (cx + (dx > 0))*self.cell_size - a[0])/dx
+            t_delta_x = self.cell_size/abs(dx)
+        else:
+            t_max_x = t_delta_x = math.inf
+        if dy != 0:
+            t_max_y = (self.y0 + (cy + (dy > 0))*self.cell_size - a[1])/dy
+            t_delta_y = self.cell_size/abs(dy)
+        else:
+            t_max_y = t_delta_y = math.inf
+
+        while True:
+            t_exit = min(t_max_x, t_max_y, t_1)
+            yield self.cell_walls_list(cx, cy), t_exit*length
+            if t_exit >= t_1:
+                return
+            if t_max_x < t_max_y:
+                cx += step_x
+                t_max_x += t_delta_x
+            else:
+                cy += step_y
+                t_max_y += t_delta_y
+            if not (0 <= cx < self.nx and 0 <= cy < self.ny):
+                return
@@ -1,13 +1,31 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <math.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 
 #define COLLISION_NONE 0
 #define COLLISION_WALL 1
 
 // Compile with:
-// cd src && gcc -std=c11 -Wall -Wextra -pedantic -fPIC -shared -o collisions.so collisions.c && cd ..
+// cd src && gcc -std=c11 -Wall -Wextra -pedantic -fPIC -shared -fopenmp -o collisions.so collisions.c -lm && cd ..
+// Without -fopenmp the kernels run in a single thread.
+
+// Set number of threads used by the kernels, n <= 0 uses all cores.
+// Returns the number of threads that will be used.
+int set_num_threads(int n) {
+#ifdef _OPENMP
+    if(n <= 0)
+        n = omp_get_num_procs();
+    omp_set_num_threads(n);
+    return n;
+#else
+    (void)n;
+    return 1;
+#endif
+}
 
 // Free memory of ptr.
 void freeme(void *ptr) {
@@ -30,19 +48,12 @@ float cross_pointer(float *v, float *w) {
     return v[0]*w[1] - v[1]*w[0];
 }
 
-// Return float based on the orientation of the three points
+// Return float based on the orientation of the three points. The points
+// aren't changed, so the result doesn't depend on the previous tests.
 float orient(float *a, float *b, float *c) {
-    b[0] -= a[0];
-    b[1] -= a[1];
-    c[0] -= a[0];
-    c[1] -= a[1];
-    float ret = cross_pointer(b, c);
-    b[0] += a[0];
-    b[1] += a[1];
-    c[0] += a[0];
-    c[1] += a[1];
-
-    return ret;
+    float u[] = {b[0] - a[0], b[1] - a[1]};
+    float v[] = {c[0] - a[0], c[1] - a[1]};
+    return cross_pointer(u, v);
 }
 
 float dot(float *a, float *b) {
@@ -50,17 +61,9 @@ float dot(float *a, float *b) {
 }
 
 int inDisk(float *a, float *b, float *p) {
-    a[0] -= p[0];
-    a[1] -= p[1];
-    b[0] -= p[0];
-    b[1] -= p[1];
-    int ret = dot(a, b) <= 0;
-    a[0] += p[0];
-    a[1] += p[1];
-    b[0] += p[0];
-    b[1] += p[1];
-
-    return ret;
+    float u[] = {a[0] - p[0], a[1] - p[1]};
+    float v[] = {b[0] - p[0], b[1] - p[1]};
+    return dot(u, v) <= 0;
 }
 
 // Detects if point p is on segment (a, b)
@@ -94,11 +97,13 @@ float dist_sq(float a[2], float b[2]) {
 // Receive a pointer to segments in a array where every 4 positions
 // is a segment.
 // Evaluate for each segment on segs if it collide with any wall.
-// Returns a int 0 or 1 based on that evaluation.
-int *col_circuit(float *segs, int n_segs, float *walls, int n_walls) {
-    int *ret = malloc(sizeof(int)*n_segs);
-    float out[2];
+// Writes in ret, owned by the caller, a int 0 or 1 based on that evaluation.
+void col_circuit(const float *segs, int n_segs, const float *walls, int n_walls,
+                    int *ret) {
+    // Each segment is independent, so segments are split between threads.
+    #pragma omp parallel for schedule(dynamic, 64)
     for(int i = 0; i < n_segs; i++) {
+        float out[2];
         float a[] = {segs[4*i], segs[4*i+1]};
         float b[] = {segs[4*i+2], segs[4*i+3]};
         ret[i] = COLLISION_NONE;
@@ -117,19 +122,17 @@ int *col_circuit(float *segs, int n_segs, float *walls, int n_walls) {
     // for(int i = 0; i < n_segs; i++)
     //     printf("%d ", ret[i]);
     // putchar('\n');
-
-    return ret;
 }
 
 // Receive a point st and an array with n_segs points.
-// Returns array with n_segs floats with distances from
+// Writes in dists, owned by the caller, n_segs floats with distances from
 // st to first wall segment collision.
-float *col_dist_circuit(float *segs, int n_segs,
-                        float *walls, int n_walls) {
-    float *dists = malloc(sizeof(int)*n_segs);
-    float out[2];
+void col_dist_circuit(const float *segs, int n_segs,
+                        const float *walls, int n_walls, float *dists) {
     // printf("st = %.2f %.2f\n", st[0], st[1]);
+    #pragma omp parallel for schedule(dynamic, 64)
     for(int i = 0; i < n_segs; i++) {
+        float out[2];
         float a[] = {segs[4*i], segs[4*i+1]};
         float b[] = {segs[4*i+2], segs[4*i+3]};
         // printf("%d: %.3f %.3f\n", i, b[0], b[1]);
@@ -152,6 +155,193 @@ float *col_dist_circuit(float *segs, int n_segs,
     // for(int i = 0; i < n_segs; i++)
     //     printf("%d ", ret[i]);
     // putchar('\n');
+}
+//// Uniform grid over the walls. Walls of cell c are
+//// cell_walls[cell_start[c]] ... cell_walls[cell_start[c+1]-1], cells are
+//// stored by rows, the cell (cx, cy) covers
+//// [x0 + cx*cell_size, x0 + (cx+1)*cell_size) x [y0 + cy*cell_size, ...).
+
+static int clamp_cell(float v, float v0, float cell_size, int n) {
+    int c = (int)floorf((v - v0)/cell_size);
+    if(c < 0)
+        return 0;
+    if(c >= n)
+        return n-1;
+    return c;
+}
+
+// Same as col_circuit, but each segment is only tested against the walls
+// in the cells overlapped by its bounding box.
+void col_circuit_grid(const float *segs, int n_segs, const float *walls,
+                        const int *cell_start, const int *cell_walls,
+                        float x0, float y0, float cell_size, int nx, int ny,
+                        int *ret) {
+    #pragma omp parallel for schedule(dynamic, 64)
+    for(int i = 0; i < n_segs; i++) {
+        float out[2];
+        float a[] = {segs[4*i], segs[4*i+1]};
+        float b[] = {segs[4*i+2], segs[4*i+3]};
+        int cx_1 = clamp_cell(fminf(a[0], b[0]), x0, cell_size, nx);
+        int cx_2 = clamp_cell(fmaxf(a[0], b[0]), x0, cell_size, nx);
+        int cy_1 = clamp_cell(fminf(a[1], b[1]), y0, cell_size, ny);
+        int cy_2 = clamp_cell(fmaxf(a[1], b[1]), y0, cell_size, ny);
+        ret[i] = COLLISION_NONE;
+        for(int cy = cy_1; cy <= cy_2 && ret[i] == COLLISION_NONE; cy++) {
+            for(int cx = cx_1; cx <= cx_2 && ret[i] == COLLISION_NONE; cx++) {
+                int c = cy*nx + cx;
+                for(int k = cell_start[c]; k < cell_start[c+1]; k++) {
+                    int j = cell_walls[k];
+                    float c_[] = {walls[4*j], walls[4*j+1]};
+                    float d[] = {walls[4*j+2], walls[4*j+3]};
+                    if(seg_inter(a, b, c_, d, out)) {
+                        ret[i] = COLLISION_WALL;
+                        break;
+                    }
+                }
+            }
+        }
+    }
+}
+
+// Distance from the start of segment (a, b) to the first wall collision,
+// walking the cells crossed by the segment in order (DDA) and stopping in
+// the first cell that contains a collision.
+static float col_dist_grid(float a[2], float b[2], const float *walls,
+                            const int *cell_start, const int *cell_walls,
+                            float x0, float y0, float cell_size, int nx, int ny) {
+    float out[2];
+    float dx = b[0] - a[0], dy = b[1] - a[1];
+    float length = sqrtf(dx*dx + dy*dy);
+    float mini = 1e18;
+
+    // Clip segment to the grid
+    float t_0 = 0, t_1 = 1;
+    float p[] = {a[0], a[1]}, d[] = {dx, dy};
+    float lo[] = {x0, y0}, hi[] = {x0 + nx*cell_size, y0 + ny*cell_size};
+    for(int k = 0; k < 2; k++) {
+        if(d[k] == 0) {
+            if(p[k] < lo[k] || p[k] > hi[k])
+                return sqrt(mini);
+        } else {
+            float t_lo = (lo[k] - p[k])/d[k], t_hi = (hi[k] - p[k])/d[k];
+            if(t_lo > t_hi) {
+                float aux = t_lo;
+                t_lo = t_hi;
+                t_hi = aux;
+            }
+            t_0 = fmaxf(t_0, t_lo);
+            t_1 = fminf(t_1, t_hi);
+        }
+    }
+    if(t_0 > t_1)
+        return sqrt(mini);
+
+    int cx = clamp_cell(a[0] + t_0*dx, x0, cell_size, nx);
+    int cy = clamp_cell(a[1] + t_0*dy, y0, cell_size, ny);
+    int step_x = dx > 0 ? 1 : -1, step_y = dy > 0 ? 1 : -1;
+    float t_max_x = INFINITY, t_delta_x = INFINITY;
+    float t_max_y = INFINITY, t_delta_y = INFINITY;
+    if(dx != 0) {
+        t_max_x = (x0 + (cx + (dx > 0))*cell_size - a[0])/dx;
+        t_delta_x = cell_size/fabsf(dx);
+    }
+    if(dy != 0) {
+        t_max_y = (y0 + (cy + (dy > 0))*cell_size - a[1])/dy;
+        t_delta_y = cell_size/fabsf(dy);
+    }
+
+    while(1) {
+        int c = cy*nx + cx;
+        for(int k = cell_start[c]; k < cell_start[c+1]; k++) {
+            int j = cell_walls[k];
+            float c_[] = {walls[4*j], walls[4*j+1]};
+            float d_[] = {walls[4*j+2], walls[4*j+3]};
+            if(seg_inter(a, b, c_, d_, out)) {
+                float dist = dist_sq(a, out);
+                if(dist < mini)
+                    mini = dist;
+            }
+        }
+        float t_exit = fminf(fminf(t_max_x, t_max_y), t_1);
+        float d_exit = t_exit*length;
+        // Any closer collision would be in the cells already visited.
+        if(mini <= d_exit*d_exit || t_exit >= t_1)
+            break;
+        if(t_max_x < t_max_y) {
+            cx += step_x;
+            t_max_x += t_delta_x;
+        } else {
+            cy += step_y;
+            t_max_y += t_delta_y;
+        }
+        if(cx < 0 || cx >= nx || cy < 0 || cy >= ny)
+            break;
+    }
+
+    return sqrt(mini);
+}
+
+// Same as col_dist_circuit, using the uniform grid over the walls.
+void col_dist_circuit_grid(const float *segs, int n_segs, const float *walls,
+                            const int *cell_start, const int *cell_walls,
+                            float x0, float y0, float cell_size, int nx, int ny,
+                            float *dists) {
+    #pragma omp parallel for schedule(dynamic, 64)
+    for(int i = 0; i < n_segs; i++) {
+        float a[] = {segs[4*i], segs[4*i+1]};
+        float b[] = {segs[4*i+2], segs[4*i+3]};
+        dists[i] = col_dist_grid(a, b, walls, cell_start, cell_walls,
+                                    x0, y0, cell_size, nx, ny);
+    }
+}
+
+//// Wall sets, each segment i is only tested against the walls of set
+//// seg_set[i], that are set_walls[set_start[s]] ... set_walls[set_start[s+1]-1].
+
+// Same as col_circuit, testing each segment only against its set of walls.
+void col_circuit_sets(const float *segs, int n_segs, const int *seg_set,
+                        const float *walls, const int *set_start,
+                        const int *set_walls, int *ret) {
+    #pragma omp parallel for schedule(dynamic, 64)
+    for(int i = 0; i < n_segs; i++) {
+        float out[2];
+        float a[] = {segs[4*i], segs[4*i+1]};
+        float b[] = {segs[4*i+2], segs[4*i+3]};
+        int s = seg_set[i];
+        ret[i] = COLLISION_NONE;
+        for(int k = set_start[s]; k < set_start[s+1]; k++) {
+            int j = set_walls[k];
+            float c[] = {walls[4*j], walls[4*j+1]};
+            float d[] = {walls[4*j+2], walls[4*j+3]};
+            if(seg_inter(a, b, c, d, out)) {
+                ret[i] = COLLISION_WALL;
+                break;
+            }
+        }
+    }
+}
 
-    return dists;
-}
\ No newline at end of file
+// Same as col_dist_circuit, testing each segment only against its set of walls.
+void col_dist_circuit_sets(const float *segs, int n_segs, const int *seg_set,
+                            const float *walls, const int *set_start,
+                            const int *set_walls, float *dists) {
+    #pragma omp parallel for schedule(dynamic, 64)
+    for(int i = 0; i < n_segs; i++) {
+        float out[2];
+        float a[] = {segs[4*i], segs[4*i+1]};
+        float b[] = {segs[4*i+2], segs[4*i+3]};
+        int s = seg_set[i];
+        float mini = 1e18;
+        for(int k = set_start[s]; k < set_start[s+1]; k++) {
+            int j = set_walls[k];
+            float c[] = {walls[4*j], walls[4*j+1]};
+            float d[] = {walls[4*j+2], walls[4*j+3]};
+            if(seg_inter(a, b, c, d, out)) {
+                float dist = dist_sq(a, out);
+                if(dist < mini)
+                    mini = dist;
+            }
+        }
+        dists[i] = sqrt(mini);
+    }
+}
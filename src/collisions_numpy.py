@@ -0,0 +1,111 @@
+import numpy as np
+
+# Same kernels as collisions.c, written as broadcasted array operations over
+# (segments x walls). Used when collisions.so is unavailable.
+
+COLLISION_NONE = 0
+COLLISION_WALL = 1
+
+# Maximum amount of (segment, wall) pairs evaluated at once
+CHUNK_PAIRS = 1 << 20
+
+def set_num_threads(n):
+    """NumPy backend runs in a single thread."""
+    return 1
+
+def chunks(n_segs, n_walls):
+    """Yields slices of the segments, each one with at most CHUNK_PAIRS
+    (segment, wall) pairs."""
+    step = max(1, CHUNK_PAIRS//max(1, n_walls))
+    for i in range(0, n_segs, step):
+        yield slice(i, min(n_segs, i + step))
+
+def cross(ax, ay, bx, by):
+    return ax*by - ay*bx
+
+def seg_inter(segs, walls):
+    """Intersection between each segment (a, b) and each wall (c, d), with the
+    same criteria as seg_inter in collisions.c. Returns the mask of
+    intersections and the parameter of the intersection point in each
+    segment, both with shape (len(segs), len(walls)). walls can also have
+    shape (len(segs), m, 4), with m walls for each segment."""
+    if walls.ndim == 2:
+        walls = walls[None]
+    ax, ay, bx, by = [segs[:, i, None] for i in range(4)]
+    cx, cy, dx, dy = [walls[..., i] for i in range(4)]
+    # orient(c, d, p) = cross(d - c, p - c)
+    oa = cross(dx - cx, dy - cy, ax - cx, ay - cy)
+    ob = cross(dx - cx, dy - cy, bx - cx, by - cy)
+    # orient(a, b, p) = cross(b - a, p - a)
+    oc = cross(bx - ax, by - ay, cx - ax, cy - ay)
+    od = cross(bx - ax, by - ay, dx - ax, dy - ay)
+    inter = (oa*ob < 0) & (oc*od < 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = oa/(oa - ob)
+    return inter, t
+
+def col_circuit(segs, n_segs, walls, n_walls, ret):
+    """Writes in ret 0 or 1 if each segment collide with any wall."""
+    segs = segs.reshape(-1, 4)[:n_segs]
+    walls = walls.reshape(-1, 4)[:n_walls]
+    for s in chunks(n_segs, n_walls):
+        inter, _ = seg_inter(segs[s], walls)
+        ret[s] = np.where(inter.any(axis=1), COLLISION_WALL, COLLISION_NONE)
+
+def col_dist_circuit(segs, n_segs, walls, n_walls, dists):
+    """Writes in dists the distance from the start of each segment to the
+    first wall collision, 1e9 if there's no collision."""
+    segs = segs.reshape(-1, 4)[:n_segs]
+    walls = walls.reshape(-1, 4)[:n_walls]
+    for s in chunks(n_segs, n_walls):
+        seg = segs[s]
+        inter, t = seg_inter(seg, walls)
+        # Point of intersection is a + t*(b - a)
+        t = np.where(inter, t, np.inf).min(axis=1)
+        length = np.hypot(seg[:, 2] - seg[:, 0], seg[:, 3] - seg[:, 1])
+        dists[s] = np.where(np.isfinite(t), t*length, np.float32(1e9))
+
+def col_circuit_grid(segs, n_segs, walls, cell_start, cell_walls,
+                        x0, y0, cell_size, nx, ny, ret):
+    """Same as col_circuit, the grid is not needed by the broadcasted test."""
+    col_circuit(segs, n_segs, walls, len(walls), ret)
+
+def col_dist_circuit_grid(segs, n_segs, walls, cell_start, cell_walls,
+                            x0, y0, cell_size, nx, ny, dists):
+    """Same as col_dist_circuit, the grid is not needed by the broadcasted test."""
+    col_dist_circuit(segs, n_segs, walls, len(walls), dists)
+
+def walls_of_sets(walls, set_start, set_walls):
+    """Returns array with shape (number of sets, m, 4), the walls of each
+    set padded with degenerated walls (a single point), that never
+    intersect a segment."""
+    lengths = np.diff(set_start)
+    m = max(1, lengths.max())
+    idx = set_start[:-1, None] + np.arange(m)
+    valid = np.arange(m) < lengths[:, None]
+    idx = np.where(valid, set_walls[np.minimum(idx, len(set_walls) - 1)], len(walls))
+    walls = np.concatenate([walls, np.zeros((1, 4), dtype=walls.dtype)])
+    return walls[idx]
+
+def col_circuit_sets(segs, n_segs, seg_set, walls, set_start, set_walls, ret):
+    """Same as col_circuit, testing each segment only against the walls of
+    its set, set_walls[set_start[s]:set_start[s+1]]."""
+    segs = segs.reshape(-1, 4)[:n_segs]
+    seg_set = seg_set[:n_segs]
+    walls_sets = walls_of_sets(walls.reshape(-1, 4), set_start, set_walls)
+    for s in chunks(n_segs, walls_sets.shape[1]):
+        inter, _ = seg_inter(segs[s], walls_sets[seg_set[s]])
+        ret[s] = np.where(inter.any(axis=1), COLLISION_WALL, COLLISION_NONE)
+
+def col_dist_circuit_sets(segs, n_segs, seg_set, walls, set_start, set_walls, dists):
+    """Same as col_dist_circuit, testing each segment only against the walls
+    of its set, set_walls[set_start[s]:set_start[s+1]]."""
+    segs = segs.reshape(-1, 4)[:n_segs]
+    seg_set = seg_set[:n_segs]
+    walls_sets = walls_of_sets(walls.reshape(-1, 4), set_start, set_walls)
+    for s in chunks(n_segs, walls_sets.shape[1]):
+        seg = segs[s]
+        inter, t = seg_inter(seg, walls_sets[seg_set[s]])
+        t = np.where(inter, t, np.inf).min(axis=1)
+        length = np.hypot(seg[:, 2] - seg[:, 0], seg[:, 3] - seg[:, 1])
+        dists[s] = np.where(np.isfinite(t), t*length, np.float32(1e9))
@@ -1,5 +1,6 @@
 import sys, platform
 import ctypes, ctypes.util
+import numpy as np
 
 collisions = True
 try:
@@ -7,24 +8,78 @@ try:
     print("Collisions.so loaded!")
 except OSError:
     collisions = False
-    print("Unable to load collisions.so.")
+    print("Unable to load collisions.so. Using NumPy collisions.")
+
+if not collisions:
+    # Same kernels written with NumPy
+    from collisions_numpy import col_circuit, col_dist_circuit, \
+        col_circuit_grid, col_dist_circuit_grid, col_circuit_sets, \
+        col_dist_circuit_sets, set_num_threads
 
 if collisions:
+    # NumPy arrays are passed by pointer, without copies. Results are written
+    # in arrays owned by the caller.
+    array_float = np.ctypeslib.ndpointer(dtype=np.float32, flags='C_CONTIGUOUS')
+    array_int = np.ctypeslib.ndpointer(dtype=np.int32, flags='C_CONTIGUOUS')
+
     # Collision for circuit
     col_circuit = col.col_circuit
-    col_circuit.argtypes = [ ctypes.POINTER(ctypes.c_float),
+    col_circuit.argtypes = [ array_float,
                                     ctypes.c_int,
-                                    ctypes.POINTER(ctypes.c_float),
-                                    ctypes.c_int]
-    col_circuit.restype = ctypes.POINTER(ctypes.c_int)
+                                    array_float,
+                                    ctypes.c_int,
+                                    array_int]
+    col_circuit.restype = None
     
     # Collision distance for  circuit
     col_dist_circuit = col.col_dist_circuit
-    col_dist_circuit.argtypes = [   ctypes.POINTER(ctypes.c_float),
+    col_dist_circuit.argtypes = [   array_float,
+                                    ctypes.c_int,
+                                    array_float,
+                                    ctypes.c_int,
+                                    array_float]
+    col_dist_circuit.restype = None
+
+    # Collision for circuit using uniform grid over the walls
+    col_circuit_grid = col.col_circuit_grid
+    col_circuit_grid.argtypes = [   array_float,
+                                    ctypes.c_int,
+                                    array_float,
+                                    array_int,
+                                    array_int,
+                                    ctypes.c_float,
+                                    ctypes.c_float,
+                                    ctypes.c_float,
                                     ctypes.c_int,
-                                    ctypes.POINTER(ctypes.c_float),
-                                    ctypes.c_int]
-    col_dist_circuit.restype = ctypes.POINTER(ctypes.c_float)
+                                    ctypes.c_int,
+                                    array_int]
+    col_circuit_grid.restype = None
+
+    # Collision distance for circuit using uniform grid over the walls
+    col_dist_circuit_grid = col.col_dist_circuit_grid
+    col_dist_circuit_grid.argtypes = col_circuit_grid.argtypes[:-1] + [array_float]
+    col_dist_circuit_grid.restype = None
+
+    # Collision for circuit testing each segment against its set of walls
+    col_circuit_sets = col.col_circuit_sets
+    col_circuit_sets.argtypes = [   array_float,
+                                    ctypes.c_int,
+                                    array_int,
+                                    array_float,
+                                    array_int,
+                                    array_int,
+                                    array_int]
+    col_circuit_sets.restype = None
+
+    # Collision distance for circuit testing each segment against its set of walls
+    col_dist_circuit_sets = col.col_dist_circuit_sets
+    col_dist_circuit_sets.argtypes = col_circuit_sets.argtypes[:-1] + [array_float]
+    col_dist_circuit_sets.restype = None
+
+    # Number of threads used by the collision kernels
+    set_num_threads = col.set_num_threads
+    set_num_threads.argtypes = [ctypes.c_int]
+    set_num_threads.restype = ctypes.c_int
 
     # Free memory of array
     freeme = col.freeme
@@ -59,7 +59,11 @@ class Controller(metaclass=ABCMeta):
     def start_track(self):
         track_name = self.config['track']
         if track_name == "custom":
-            self.track = self.run_circuit_maker()
+            if 'headless' in self.config and self.config['headless']:
+                print("Custom circuit can't be created in headless mode.")
+                self.track = None
+            else:
+                self.track = self.run_circuit_maker()
         else:
             self.track = Circuit(self.config, track_name)
 
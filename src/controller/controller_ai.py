@@ -3,26 +3,47 @@ import random
 import time
 from datetime import datetime
 from functools import partial
-from collections import deque
 from pprint import pprint
 
-from car import Car
-from view import View
+import numpy as np
+
+from car_fleet import CarFleet
+from view import View, ViewHeadless
 from ai_ga import AIGA
+from ai_cmaes import AICMAES
+from ai_ga_steady import AIGASteady
 from controller.controller import Controller
 from circuit.circuit import Circuit
+from circuit.circuit_set import CircuitSet
+
+def create_ai(config, ai_info):
+    """Returns the optimizer of config, AIGA by default."""
+    steady = 'steady_state' in config['ai'] and config['ai']['steady_state']
+    if 'optimizer' in config['ai'] and config['ai']['optimizer'] == 'cmaes':
+        if steady:
+            print("Steady state is only available with the GA optimizer.")
+            exit(0)
+        return AICMAES(config, ai_info)
+    if steady:
+        return AIGASteady(config, ai_info)
+    return AIGA(config, ai_info)
 
 class ControllerAI(Controller):
     def __init__(self, config, ai_info = None):
         super(Controller, self).__init__()
-        self.view = View(config)
+        self.headless = 'headless' in config and config['headless']
+        if self.headless:
+            self.view = ViewHeadless(config)
+        else:
+            self.view = View(config)
         self.config = config
         self.ai_info = ai_info
-        to_print = {}
-        for x in config.keys():
-            if not x.startswith("circuit_"):
-                to_print[x] = config[x]
-        pprint(to_print)
+        if config['verbose'] > 0:
+            to_print = {}
+            for x in config.keys():
+                if not x.startswith("circuit_"):
+                    to_print[x] = config[x]
+            pprint(to_print)
 
     def get_car_data_str(self, car):
         """Builds a dict about the car car and returns it."""
@@ -34,9 +55,9 @@ class ControllerAI(Controller):
         car_data['angle'] = str("%.2fº | %.2f rads" % (car.get_angle_degrees(), car.get_angle()))
         return car_data
         
-    def reset(self, car, car_id, track):
-        """Resets car and track."""
-        car.reset()
+    def reset(self, fleet, car_id, track):
+        """Resets car with car_id in fleet and track."""
+        fleet.reset([car_id])
         track.reset(car_id, self.view.num_frame)
 
     def wait_key(self, key):
@@ -57,29 +78,94 @@ class ControllerAI(Controller):
                 return True
         return False
 
-    def deactivate_car(self, car, ai):
-        """Deactivate a car and set evaluation to ai."""
-        ai.set_evaluation(car['id'], {
-            'perc_of_sectors' : self.track.get_car_perc_sectors(car['id']),
-            'amount_frames' : self.track.get_car_num_frames(car['id'], self.view.num_frame)
-        })
-        car['active'] = False
+    def deactivate_cars(self, car_ids):
+        """Deactivate cars with car_ids and set their evaluation to ai, in
+        the order received."""
+        for car_id in car_ids:
+            car_id = int(car_id)
+            self.set_car_evaluation(car_id, {
+                'perc_of_sectors' : float(self.track.get_car_perc_sectors(car_id)),
+                'amount_frames' : int(self.track.get_car_num_frames(car_id, self.view.num_frame))
+            })
+            self.active[car_id] = False
 
-    def run(self):
-        """Run project."""
-        x_track_offset = self.config['width']//3
-        self.start_track()
-        if self.track == None:
+    def set_car_evaluation(self, car_id : int, features : dict, exact = True):
+        """Sets features of the car with car_id in ai. With a set of tracks,
+        the features of an individual are set when all its cars were
+        evaluated, with the mean of perc_of_sectors, the sum of
+        amount_frames and the features in each track."""
+        if self.tracks == None:
+            self.ai.set_evaluation(car_id, features, exact)
+            if self.steady:
+                self.respawn_genomes.append(car_id)
             return
+        genome = car_id%self.population_size
+        tracks_features = self.tracks_features[genome]
+        tracks_features[car_id//self.population_size] = features
+        self.tracks_exact[genome] = self.tracks_exact[genome] and exact
+        if not None in tracks_features:
+            self.ai.set_evaluation(genome, {
+                'perc_of_sectors' : sum(x['perc_of_sectors'] for x in tracks_features)/self.num_of_tracks,
+                'amount_frames' : sum(x['amount_frames'] for x in tracks_features),
+                'tracks' : list(tracks_features)
+            }, self.tracks_exact[genome])
+            if self.steady:
+                self.respawn_genomes.append(genome)
+
+    def respawn(self):
+        """In steady state, puts the cars of the individuals evaluated back in
+        the start, driven by the new individuals of their slots."""
+        for genome in self.respawn_genomes:
+            car_ids = np.arange(genome, len(self.cars), self.population_size)
+            self.fleet.reset(car_ids)
+            self.track.reset(car_ids, self.view.num_frame)
+            self.cars_start_frame[car_ids] = self.view.num_frame
+            self.active[car_ids] = True
+            self.delta_pixels_hist[car_ids] = 1
+            if self.tracks != None:
+                self.tracks_features[genome] = [None for i in range(self.num_of_tracks)]
+                self.tracks_exact[genome] = True
+        self.respawn_genomes = []
+
+    def reset_tracks_features(self):
+        """Clears features of the individuals in each track."""
+        self.tracks_features = [[None for i in range(self.num_of_tracks)]
+                                    for j in range(self.population_size)]
+        self.tracks_exact = [True for j in range(self.population_size)]
+
+    def start_tracks(self):
+        """Creates the track. With a set of tracks in config, the population
+        is evaluated in all of them at once, one car of each individual
+        in each track."""
+        self.population_size = self.config['ai']['population_size']
+        self.tracks = None
+        self.num_of_tracks = 1
+        if not 'tracks' in self.config['ai'] or len(self.config['ai']['tracks']) == 0:
+            self.start_track()
+            return
+        self.tracks = self.config['ai']['tracks']
+        if "custom" in self.tracks:
+            print("Custom circuit can't be in a set of tracks.")
+            self.track = None
+            return
+        self.num_of_tracks = len(self.tracks)
+        self.track = CircuitSet(self.config, self.tracks, self.population_size)
+
+    def setup(self):
+        """Creates track, cars and AI. Returns False if the track couldn't
+        be created."""
+        self.x_track_offset = self.config['width']//3
+        self.start_tracks()
+        if self.track == None:
+            return False
         self.start_car()
         self.view.num_frame = 0
         self.view.num_frame_now = 0
 
         if self.config["graphics"]:
-            circuit_surface = self.track.draw()
+            self.circuit_surface = self.track.draw()
 
-        num_of_cars = self.config['ai']['population_size']        
-        cars = []
+        num_of_cars = self.population_size*self.num_of_tracks
         colors = [list(x[1]) for x in pygame.color.THECOLORS.items()]
         to_remove = []
         for x in colors:
@@ -92,106 +178,207 @@ class ControllerAI(Controller):
             cars_colors = random.choices(colors, k=(num_of_cars-1))
         else:
             cars_colors = random.sample(colors, k=(num_of_cars-1))
-        while(len(cars) < num_of_cars):
-            config_car_now = self.config_car.copy()
-            if len(cars) == 0:
-                config_car_now['car_color'] = (0, 0, 255, 255)
-            else:
-                config_car_now['car_color'] = cars_colors.pop()
-                config_car_now['front_color'][3] = 80
-            cars.append({})
-            cars[-1]['car'] = Car(config_car_now)
-            cars[-1]['id'] = self.track.add_car(cars[-1], self.view.num_frame)
-            cars[-1]['active'] = True
-            if len(cars) == 1:
-                cars[-1]['car'].show_vision = True
-
-        ai = AIGA(self.config, self.ai_info)
-
-        for car in cars:
+        self.fleet = CarFleet(self.config_car, num_of_cars, True)
+        self.fleet.car_color[0] = (0, 0, 255, 255)
+        for i in range(1, num_of_cars):
+            self.fleet.car_color[i] = cars_colors.pop()
+        if num_of_cars > 1:
+            self.fleet.front_color[3] = 80
+        if self.tracks != None:
+            for k, circuit in enumerate(self.track.circuits):
+                car_ids = np.arange(k*self.population_size, (k + 1)*self.population_size)
+                self.fleet.set_start(car_ids, circuit.start[0], circuit.start[1], circuit.start_angle)
+            self.fleet.reset()
+        self.cars = []
+        for car_id in self.track.add_cars(num_of_cars, self.view.num_frame):
+            self.cars.append({})
+            self.cars[-1]['id'] = int(car_id)
+        # Cars still being evaluated, only them are simulated
+        self.active = np.ones(num_of_cars, dtype=bool)
+
+        self.ai = create_ai(self.config, self.ai_info)
+        # Steady state, each car is put back in the start with a new
+        # individual as soon as it's evaluated
+        self.steady = 'steady_state' in self.config['ai'] and self.config['ai']['steady_state']
+        self.respawn_genomes = []
+        self.cars_start_frame = np.full(num_of_cars, self.view.num_frame)
+        # Maximum number of frames of each car, that depends on its track
+        if self.tracks != None:
+            self.cars_max_frames = np.repeat(self.ai.tracks_max_frames, self.population_size)
+        else:
+            self.cars_max_frames = np.full(num_of_cars, self.ai.max_frames)
+        self.reset_tracks_features()
+
+        for car in self.cars:
             car['name'] = "ai_%d" % car['id']
 
-        # To check if all cars are doing something, a list of deques with the
-        # last x delta_pixels of each car.
-        history_length = 3
-        delta_pixels_hist = [deque([1 for x in range(history_length)]).copy() for x in range(num_of_cars)]
+        # To check if all cars are doing something, the last
+        # history_length delta_pixels of each car. It's a ring, in each
+        # frame the active cars write in the column num_frame%history_length.
+        self.history_length = 3
+        self.delta_pixels_hist = np.ones((num_of_cars, self.history_length))
+
+        # Policy and vision are evaluated every decision_interval frames, the
+        # last movement is applied in between.
+        if 'decision_interval' in self.config['ai']:
+            self.decision_interval = self.config['ai']['decision_interval']
+        else:
+            self.decision_interval = 1
+        # Frames in which the cars with less progress are pruned, with the
+        # tracks pruned in each one, checkpoints are fractions of the
+        # max_frames of each track. Cars of a steady state run don't start
+        # together, so they aren't pruned
+        self.pruning_frames = {}
+        if 'pruning_checkpoints' in self.config['ai'] and not self.steady:
+            for k in range(self.num_of_tracks):
+                max_frames = self.cars_max_frames[k*self.population_size]
+                for x in self.config['ai']['pruning_checkpoints']:
+                    self.pruning_frames.setdefault(int(round(x*max_frames)), []).append(k)
+        if 'pruning_percentile' in self.config['ai']:
+            self.pruning_percentile = self.config['ai']['pruning_percentile']
+        else:
+            self.pruning_percentile = 50
+
+        self.skip_cached()
+        return True
+
+    def skip_cached(self):
+        """Cars with individuals found in the fitness cache are evaluated
+        without being simulated. With pruning, the thresholds depend on the
+        progress of every car, so they're simulated until the last pruning
+        checkpoint and only the ones still active are evaluated from the
+        cache then. Every car is shown when there's graphics."""
+        if self.config['graphics']:
+            return
+        if len(self.pruning_frames) and self.view.num_frame_now < max(self.pruning_frames):
+            return
+        # Individuals with all their cars active, pruned ones aren't exact
+        genomes = np.flatnonzero(self.active.reshape(self.num_of_tracks, -1).all(axis=0))
+        for genome in self.ai.evaluate_cached(genomes):
+            self.active[genome::self.population_size] = False
+
+    def prune(self, track : int):
+        """Deactivates the active cars of track, its index in the set of
+        tracks, with progress along the track below pruning_percentile of
+        the active cars of the same track. They're evaluated as cars that
+        crashed in the frame they're pruned, with their sectors and frames
+        at the moment, so the fitness keeps their order with the cars that
+        crashed before (max_frames would rank them below those)."""
+        first = track*self.population_size
+        active_ids = np.flatnonzero(self.active[first:first + self.population_size]) + first
+        if len(active_ids) < 2:
+            return
+        progress = self.track.get_car_progress(active_ids)
+        threshold = np.percentile(progress, self.pruning_percentile)
+        for car_id in active_ids[progress < threshold]:
+            self.set_car_evaluation(int(car_id), {
+                'perc_of_sectors' : float(self.track.get_car_perc_sectors(car_id)),
+                'amount_frames' : int(self.track.get_car_num_frames(car_id, self.view.num_frame))
+            }, False)
+            self.active[car_id] = False
+
+    def reset_generation(self):
+        """Resets cars and track to evaluate a new generation. In steady
+        state cars are reset as they're evaluated."""
+        if self.steady:
+            return
+        self.view.num_frame_now = 0
+        for car in self.cars:
+            car['name'] = "ai_%d" % car['id']
+        self.active[:] = True
+        self.track.reset(np.arange(len(self.cars)), self.view.num_frame)
+        self.fleet.reset()
+        self.cars_start_frame[:] = self.view.num_frame
+        self.delta_pixels_hist[:] = 1
+        self.reset_tracks_features()
+        self.skip_cached()
 
-        running = True
-        while running:
+    def run_generation(self):
+        """Simulates cars until the whole population is evaluated. Returns
+        False if the user closed the window before."""
+        fleet = self.fleet
+        ai = self.ai
+        population = ai.ask()
+        while True:
             if self.config["graphics"]:
-                self.view.blit(circuit_surface, [x_track_offset, 0])
+                self.view.blit(self.circuit_surface, [self.x_track_offset, 0])
             
-            # Batch check collision for all cars:
-            batch_col = self.track.batch_collision_car([car['car'] for car in cars])
-            for i in range(num_of_cars):
-                cars[i]['collision'] = batch_col[i]
-
-            # Batch update vision in all cars:
-            list_shapes = []
-            for car in cars:
-                list_shapes.extend(car['car'].get_points_vision())
-            batch_col = self.track.batch_collision_dist(list_shapes)
-            p_now = 0
-            for car in cars:
-                dists_col = batch_col[p_now : p_now + len(car['car'].vision)]
-                p_now += len(car['car'].vision)
-                car['car'].vision = [x/car['car'].vision_length for x in dists_col]
-
-            # Set information about first car on view
-            visions = []
-            speeds = []
-            for car in cars[:1]:
-                visions.append(car['car'].vision)
-                speeds.append(car['car'].get_speed())
-            self.view.set_data_ai_activation(ai.population[:1], visions, speeds)
-
-            # First car (cars[0:1]) is updated last, to be on top of all others
-            for car in cars[1:] + cars[0:1]:
-                if not car['active']:
-                    continue
-                # Draw Car
-                if self.config["graphics"]:
-                    car_surface = car['car'].draw()
-                    if self.config["graphics"]:
-                        self.view.blit(car_surface, car['car'].get_pos_surface())
-                # Update car sector
-                self.track.update_car_sector(car['id'], car['car'])
-                # Update delta_pixels history:
-                delta_pixels_hist[car['id']].popleft()
-                delta_pixels_hist[car['id']].append(car['car'].delta_pixels)
-
-                car['car'].movement = ai.calc_movement(car['id'], car['car'].vision, car['car'].get_speed())
-                car['car'].apply_movement()
-
-                if(car['collision'] == Circuit.COLLISION_WALL):
-                    self.deactivate_car(car, ai)
-                else:
-                    car['car'].set_friction_multiplier(1)
-                
-                if car['active'] and (self.track.finished(car['id']) or \
-                        self.track.get_car_num_frames(car['id'], self.view.num_frame) == \
-                                ai.max_frames):
-                    self.deactivate_car(car, ai)
-
-                if self.view.num_frame_now > 15 and car['active'] and sum(delta_pixels_hist[car['id']]) < 0.5:
-                    self.deactivate_car(car, ai)
+            # Only cars active in this frame are simulated
+            active_ids = np.flatnonzero(self.active)
+            # Each car decides every decision_interval frames since its start
+            frames = self.view.num_frame - self.cars_start_frame[active_ids]
+            decide_ids = active_ids[frames%self.decision_interval == 0]
+
+            # Batch check collision for all active cars:
+            body_points = fleet.get_points(active_ids)
+            collided = self.track.batch_collision_points(body_points, active_ids) == Circuit.COLLISION_WALL
+
+            if len(decide_ids):
+                # Batch update vision in all cars deciding:
+                batch_col = self.track.batch_collision_dist(fleet.get_points_vision(decide_ids), decide_ids)
+                fleet.vision[decide_ids] = np.reshape(batch_col, (len(decide_ids), fleet.number_of_visions))/fleet.vision_length
+
+                # Set information about first car on view, the weights of
+                # the linear policy
+                if ai.policy == 'linear':
+                    self.view.set_data_ai_activation(population[:1], fleet.vision[:1].tolist(), fleet.get_speed([0]).tolist())
+
+                # Movement of all cars deciding at once
+                # Cars of the same individual in each track share its genome
+                fleet.movement[decide_ids] = ai.calc_movements(decide_ids%self.population_size,
+                                                fleet.vision[decide_ids], fleet.get_speed(decide_ids))
+
+            # Update sector of all active cars
+            self.track.update_cars_sector(active_ids, body_points)
+
+            # Update delta_pixels history:
+            self.delta_pixels_hist[active_ids, self.view.num_frame%self.history_length] = \
+                fleet.delta_pixels[active_ids]
+            fleet.friction_multiplier[active_ids[~collided]] = 1
+
+            # Cars that collided, finished, reached max_frames or stopped
+            done = collided | self.track.finished(active_ids) | \
+                (frames == self.cars_max_frames[active_ids]) | \
+                ((frames > 15) & (self.delta_pixels_hist[active_ids].sum(axis=1) < 0.5))
+
+            # First car is updated last, to be on top of all others
+            order = np.concatenate([active_ids[active_ids != 0], active_ids[active_ids == 0]])
+            # Draw Car, only the cars in the first track
+            if self.config["graphics"]:
+                for car_id in order[order < self.population_size]:
+                    self.view.blit(fleet.draw(car_id), fleet.get_pos_surface(car_id))
+            self.deactivate_cars(order[np.isin(order, active_ids[done])])
+
+            fleet.apply_movement(active_ids)
+
+            if self.view.num_frame_now in self.pruning_frames:
+                for track in self.pruning_frames[self.view.num_frame_now]:
+                    self.prune(track)
+                self.skip_cached()
                     
-            # self.view.draw_car_ai_eval(cars, ai.features, [0, 60], True)
+            # self.view.draw_car_ai_eval(self.cars, ai.features, [0, 60], True)
             self.view.update()
+            self.respawn()
 
             # Generation is over
             if ai.population_evaluated():
-                if ai.next_generation():
-                    self.view.num_frame_now = 0
-                    for i in range(num_of_cars):
-                        cars[i]['name'] = "ai_%d" % cars[i]['id']
-                        cars[i]['active'] = True
-                        self.reset(cars[i]['car'], cars[i]['id'], self.track)
-                    delta_pixels_hist = [deque([1 for x in range(history_length)]).copy() for x in range(num_of_cars)]
-                else:
-                    running = False
+                return True
 
             # Events
-            for event in pygame.event.get():
-                if self.is_exit(event):
-                    running = False
\ No newline at end of file
+            if not self.headless:
+                for event in pygame.event.get():
+                    if self.is_exit(event):
+                        return False
+
+    def run(self):
+        """Run project."""
+        if not self.setup():
+            return
+        # Pending checkpoints are written even when interrupted
+        try:
+            while self.run_generation():
+                if not self.ai.tell():
+                    break
+                self.reset_generation()
+        finally:
+            self.ai.close()
@@ -0,0 +1,224 @@
+import time
+from copy import deepcopy
+from collections import deque
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from transport import TransportLocal, TransportSocket, get_authkey
+from controller.controller import Controller
+from controller.controller_ai import ControllerAI, create_ai
+
+def run_worker(conn, threads = 1):
+    """Runs a worker of this machine with connection conn."""
+    ControllerWorker(conn, threads).run()
+
+class ControllerWorker(Controller):
+    def __init__(self, conn, threads = None):
+        """Evaluates batches of individuals received from the coordinator in
+        conn, simulating them headless. threads overrides the number of
+        threads of the collisions in the config received."""
+        super(Controller, self).__init__()
+        self.conn = conn
+        self.threads = threads
+        self.config = None
+        self.controller = None
+
+    def set_config(self, config):
+        """Sets config received from the coordinator."""
+        self.config = config
+        self.config['headless'] = True
+        self.config['graphics'] = False
+        self.config['verbose'] = 0
+        self.config['ai']['train'] = False
+        self.config['ai']['save'] = False
+        # Individuals in the coordinator cache are never sent
+        self.config['ai']['cache_size'] = 0
+        # Pruning thresholds need the progress of the whole generation, a
+        # worker only has its batch
+        self.config['ai']['pruning_checkpoints'] = []
+        if self.threads != None:
+            if not 'collisions' in self.config:
+                self.config['collisions'] = {}
+            self.config['collisions']['threads'] = self.threads
+        self.controller = None
+
+    def evaluate(self, population):
+        """Returns list of features of each individual in population and
+        list with False for the ones that aren't exact. The controller is
+        built once with batch_size cars, the cars of the individuals after
+        a shorter batch aren't simulated."""
+        size = len(population)
+        if self.controller == None or self.controller.ai.population_size < size:
+            config = deepcopy(self.config)
+            config['ai']['population_size'] = max(size, self.config['distributed']['batch_size'])
+            self.controller = ControllerAI(config)
+            self.controller.setup()
+        else:
+            self.controller.reset_generation()
+        ai = self.controller.ai
+        ai.population[:size] = population
+        ai.reset_evaluation()
+        # Unused individuals count as evaluated and their cars, in every
+        # track, are deactivated
+        for genome in range(size, ai.population_size):
+            ai.set_evaluation(genome, {}, False)
+        self.controller.active.reshape(self.controller.num_of_tracks, -1)[:, size:] = False
+        self.controller.run_generation()
+        return ai.features[:size], ai.features_exact[:size]
+
+    def run(self):
+        """Evaluates batches until the coordinator stops or leaves."""
+        try:
+            while True:
+                msg = self.conn.recv()
+                if msg[0] == 'config':
+                    self.set_config(msg[1])
+                elif msg[0] == 'eval':
+                    _, generation, batch, population = msg
+                    features, exact = self.evaluate(population)
+                    self.conn.send(('result', generation, batch, features, exact))
+                else:
+                    break
+        except (EOFError, OSError):
+            pass
+        self.conn.close()
+
+class ControllerCoordinator(Controller):
+    def __init__(self, config, ai_info = None):
+        """Owns the GA and sends batches of individuals to be evaluated by
+        workers, in this machine (transport 'local') or connected by TCP or
+        Unix sockets ('tcp' and 'unix'). A batch is sent again to another
+        worker if its worker leaves or takes more than timeout seconds."""
+        super(Controller, self).__init__()
+        self.config = config
+        self.ai_info = ai_info
+        distributed = config['distributed']
+        self.transport_name = distributed['transport']
+        self.batch_size = distributed['batch_size']
+        self.timeout = distributed['timeout']
+        self.verbose = config['verbose']
+        self.workers = []
+
+    def start_transport(self):
+        """Starts transport used to find workers."""
+        distributed = self.config['distributed']
+        if self.transport_name == 'local':
+            self.transport = TransportLocal(run_worker, distributed['workers'])
+        elif self.transport_name in ('tcp', 'unix'):
+            authkey = get_authkey(self.config, True)
+            if authkey == None:
+                exit(0)
+            self.transport = TransportSocket(distributed['address'], authkey)
+            if self.verbose > 0:
+                print("Waiting for workers in", distributed['address'])
+        else:
+            print("Unknown transport %s." % self.transport_name)
+            exit(0)
+
+    def add_worker(self, conn):
+        """Sends config to a new worker."""
+        if self.send(conn, ('config', self.config)):
+            self.workers.append(conn)
+            if self.verbose > 0:
+                print("Worker joined, %d workers." % len(self.workers))
+
+    def remove_worker(self, conn, assigned, pending):
+        """Removes worker, its batch is sent to another one if it wasn't
+        already sent again."""
+        if conn in assigned:
+            batch, t_sent = assigned.pop(conn)
+            if t_sent != None:
+                pending.appendleft(batch)
+        if conn in self.workers:
+            self.workers.remove(conn)
+            if self.verbose > 0:
+                print("Worker left, %d workers." % len(self.workers))
+        conn.close()
+
+    def send(self, conn, msg):
+        """Sends msg to conn, returns False if the worker left."""
+        try:
+            conn.send(msg)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def evaluate_generation(self):
+        """Sends batches of the population to the workers until all of them
+        are evaluated. A batch that takes more than timeout seconds is sent
+        again to another worker, its worker is kept and its result is still
+        used if it arrives first. Returns False if there are no workers
+        and no more can join."""
+        ai = self.ai
+        population = ai.ask()
+        ai.evaluate_cached()
+        car_ids = [i for i in range(ai.population_size) if ai.features[i] == None]
+        pending = deque(tuple(car_ids[i:i + self.batch_size])
+                        for i in range(0, len(car_ids), self.batch_size))
+        # Batch and time it was sent to each worker, None after it timed out
+        assigned = {}
+        while not ai.population_evaluated():
+            for conn in self.transport.new_connections():
+                self.add_worker(conn)
+
+            for conn in list(self.workers):
+                if conn in assigned or not pending:
+                    continue
+                # Individuals of batches sent again may be already evaluated
+                batch = tuple(i for i in pending.popleft() if ai.features[i] == None)
+                if not batch:
+                    continue
+                if self.send(conn, ('eval', ai.generation, batch, population[list(batch)])):
+                    assigned[conn] = (batch, time.time())
+                else:
+                    pending.appendleft(batch)
+                    self.remove_worker(conn, assigned, pending)
+
+            if not self.workers:
+                if not self.transport.accepts_workers():
+                    print("No workers left to evaluate the population.")
+                    return False
+                time.sleep(0.1)
+                continue
+            for conn in wait(self.workers, 0.1):
+                try:
+                    _, generation, batch, features, exact = conn.recv()
+                except (EOFError, OSError):
+                    self.remove_worker(conn, assigned, pending)
+                    continue
+                if conn in assigned and assigned[conn][0] == batch:
+                    del assigned[conn]
+                if generation == ai.generation:
+                    for car_id, feat, feat_exact in zip(batch, features, exact):
+                        ai.set_evaluation(car_id, feat, feat_exact)
+
+            now = time.time()
+            for conn, (batch, t_sent) in list(assigned.items()):
+                if t_sent != None and now - t_sent > self.timeout:
+                    if self.verbose > 0:
+                        print("Worker timed out in batch", batch)
+                    pending.append(batch)
+                    assigned[conn] = (batch, None)
+        return True
+
+    def run(self):
+        """Run GA until the number of generations is achieved."""
+        self.ai = create_ai(self.config, self.ai_info)
+        if 'pruning_checkpoints' in self.config['ai'] and len(self.config['ai']['pruning_checkpoints']) and \
+                self.verbose > 0:
+            print("Pruning is not used by workers, each one only has its batch.")
+        self.start_transport()
+        try:
+            while True:
+                if not self.evaluate_generation():
+                    break
+                if not self.ai.tell():
+                    break
+        except KeyboardInterrupt:
+            pass
+        self.ai.close()
+        for conn in self.workers:
+            self.send(conn, ('stop',))
+            conn.close()
+        self.transport.close()
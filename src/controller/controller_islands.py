@@ -0,0 +1,140 @@
+import queue
+import random
+import multiprocessing
+from copy import deepcopy
+
+import numpy as np
+
+from controller.controller import Controller
+from controller.controller_ai import ControllerAI
+
+def run_island(config, ai_info, island_id, seed, migrants_in, migrants_out, stats):
+    """Runs the GA of one island headless. Every migration_interval
+    generations its best individuals are sent to the next island and the
+    worst ones are replaced by the ones received from the previous."""
+    random.seed(seed)
+    # The end of the island is always sent, so the run doesn't wait for it
+    try:
+        controller = ControllerAI(config, ai_info)
+        if not controller.setup():
+            return
+        ai = controller.ai
+        interval = config['ai']['migration_interval']
+        size = config['ai']['migration_size']
+        # Processes don't run exit handlers, checkpoints are written here
+        try:
+            while controller.run_generation():
+                ai.calc_fitness()
+                stats.put((island_id, ai.generation, max(ai.fitness), sum(ai.fitness)/len(ai.fitness)))
+                if interval > 0 and ai.generation%interval == 0 and ai.generation < ai.num_generations:
+                    migrants_out.put(ai.get_best(size))
+                    ai.migrate(*migrants_in.get())
+                if not ai.tell():
+                    break
+                controller.reset_generation()
+        finally:
+            ai.close()
+    finally:
+        stats.put((island_id, None, None, None))
+
+class ControllerIslands(Controller):
+    def __init__(self, config, ai_info = None):
+        """Splits the population between islands, each one evolved by its own
+        process, with migration of the best individuals in a ring."""
+        super(Controller, self).__init__()
+        self.config = config
+        self.ai_info = ai_info
+        self.num_of_islands = config['ai']['islands']
+        self.island_size = config['ai']['population_size']//self.num_of_islands
+        self.island_size -= self.island_size%2
+        if self.island_size < 2:
+            print("Population size must have at least 2 individuals per island!")
+            exit(0)
+        if 'seed' in config:
+            self.seed = config['seed']
+        else:
+            self.seed = random.getrandbits(64)
+        self.verbose = config['verbose']
+
+    def get_island_config(self, island_id):
+        """Returns config of island with island_id."""
+        config = deepcopy(self.config)
+        config['headless'] = True
+        config['graphics'] = False
+        config['verbose'] = 0
+        config['ai']['population_size'] = self.island_size
+        config['ai']['island'] = island_id
+        if not 'migration_interval' in config['ai']:
+            config['ai']['migration_interval'] = 5
+        if not 'migration_size' in config['ai']:
+            config['ai']['migration_size'] = 1
+        if 'cache_file' in config['ai'] and config['ai']['cache_file']:
+            config['ai']['cache_file'] += ".island-" + str(island_id)
+        # Cores are already used by the islands
+        if not 'collisions' in config:
+            config['collisions'] = {}
+        config['collisions']['threads'] = 1
+        return config
+
+    def get_island_ai_info(self, island_id):
+        """Returns the individuals of ai_info used by island_id, each island
+        receives every num_of_islands individual."""
+        if not self.ai_info:
+            return None
+        ai_info = dict(self.ai_info)
+        ai_info['population'] = self.ai_info['population'][island_id::self.num_of_islands]
+        return ai_info
+
+    def run(self):
+        """Run islands until all of them finish."""
+        # Independent stream of random numbers for each island
+        seeds = np.random.SeedSequence(self.seed).spawn(self.num_of_islands)
+        queues = [multiprocessing.Queue() for i in range(self.num_of_islands)]
+        stats = multiprocessing.Queue()
+        processes = []
+        for i in range(self.num_of_islands):
+            processes.append(multiprocessing.Process(
+                target=run_island,
+                args=(  self.get_island_config(i), self.get_island_ai_info(i), i,
+                        int(seeds[i].generate_state(1, np.uint64)[0]),
+                        queues[i], queues[(i+1)%self.num_of_islands], stats)))
+            processes[-1].start()
+
+        if self.verbose > 0:
+            print("%d islands of %d individuals" % (self.num_of_islands, self.island_size))
+        running = self.num_of_islands
+        generations = {}
+        try:
+            while running:
+                # An island that died stops the run, the others would wait
+                # for its migrants forever
+                dead = [i for i, x in enumerate(processes) if x.exitcode not in (None, 0)]
+                if dead:
+                    print("Island %d stopped with an error, stopping the run." % dead[0])
+                    for process in processes:
+                        process.terminate()
+                    break
+                try:
+                    island_id, generation, best, avr = stats.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if generation == None:
+                    running -= 1
+                    continue
+                generations.setdefault(generation, {})[island_id] = (best, avr)
+                if len(generations[generation]) == self.num_of_islands:
+                    self.print_generation(generation, generations.pop(generation))
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+        for process in processes:
+            process.join()
+
+    def print_generation(self, generation, islands):
+        """Prints fitness of all islands in generation."""
+        if self.verbose > 0:
+            print("Generation %d." % generation)
+            print("\tBest fitness by island:", ["%.2f" % islands[i][0] for i in sorted(islands)])
+            print("\tBest fitness: %.2f" % max(x[0] for x in islands.values()))
+            print("\tAvr fitness: %.2f" % (sum(x[1] for x in islands.values())/len(islands)))
+            print("")
@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+class FitnessCache(object):
+    def __init__(self, context : dict, max_size : int, file_path = None):
+        """LRU cache with the features of evaluated individuals, keyed by the
+        hash of the genome and context, dict with everything else that
+        changes the evaluation (track, max_frames, physics). Keeps at most
+        max_size entries. If file_path is received, new entries are appended
+        to it, one json per line, and loaded back when the cache is created.
+        The file is rewritten with only the entries in the cache when it's
+        loaded and closed, so it doesn't keep the evicted ones."""
+        self.context = hashlib.sha1(json.dumps(context, sort_keys=True).encode()).digest()
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.file = None
+        self.file_path = file_path
+        # Lines in the file, entries evicted included
+        self.file_lines = 0
+        if file_path:
+            if os.path.exists(file_path):
+                self.load(file_path)
+            if self.file_lines > len(self.entries):
+                self.write(file_path)
+            self.file = open(file_path, 'a')
+
+    def key(self, genome):
+        """Returns key of genome in this context."""
+        genome = np.ascontiguousarray(genome, dtype=np.float64)
+        return hashlib.sha1(self.context + genome.tobytes()).hexdigest()
+
+    def insert(self, key, features):
+        """Inserts entry as the most recently used, evicting the least recently
+        used if the cache is full."""
+        self.entries[key] = features
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, genome):
+        """Returns features of genome, None if it isn't in the cache."""
+        key = self.key(genome)
+        if not key in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def peek(self, genome):
+        """Returns features of genome, None if it isn't in the cache, without
+        marking it as used."""
+        key = self.key(genome)
+        if not key in self.entries:
+            return None
+        return self.entries[key]
+
+    def put(self, genome, features : dict):
+        """Sets features of genome."""
+        key = self.key(genome)
+        if self.file and not key in self.entries:
+            self.file.write(json.dumps([key, features]) + "\n")
+            self.file_lines += 1
+        self.insert(key, features)
+
+    def load(self, file_path):
+        """Loads entries appended to file_path, the last ones are the most
+        recently used. Incomplete lines (interrupted runs) are ignored."""
+        with open(file_path, 'r') as f:
+            for line in f:
+                self.file_lines += 1
+                try:
+                    key, features = json.loads(line)
+                except ValueError:
+                    continue
+                self.insert(key, features)
+
+    def write(self, file_path):
+        """Writes the entries in the cache in file_path, the least recently
+        used first, replacing it only when complete."""
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            for key, features in self.entries.items():
+                f.write(json.dumps([key, features]) + "\n")
+        os.replace(tmp_path, file_path)
+        self.file_lines = len(self.entries)
+
+    def flush(self):
+        """Writes pending entries to the file."""
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        """Writes pending entries and closes the file, rewritten without the
+        entries evicted."""
+        if self.file:
+            self.file.close()
+            self.file = None
+            if self.file_lines > len(self.entries):
+                self.write(self.file_path)
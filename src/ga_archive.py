@@ -0,0 +1,129 @@
+import os
+import json
+import numpy as np
+
+# Features of each individual, stored as columns of a structured array
+FEATURES_DTYPE = np.dtype([('perc_of_sectors', np.float64), ('amount_frames', np.int64)])
+
+def get_features_dtype(num_of_tracks : int):
+    """Returns dtype of the features of runs with num_of_tracks tracks. Runs
+    in a set of tracks also store the features in each track, as columns
+    tracks_<name> with one position per track."""
+    if num_of_tracks == 0:
+        return FEATURES_DTYPE
+    return np.dtype(FEATURES_DTYPE.descr + [('tracks_' + name, FEATURES_DTYPE[name], (num_of_tracks,))
+                                            for name in FEATURES_DTYPE.names])
+
+class GAArchive(object):
+    def __init__(self, folder_path : str):
+        """Binary archive of the generations of a run in folder_path. Each
+        generation is appended to raw files, population.bin, fitness.bin
+        and features.bin, and index.json keeps where each generation starts,
+        so any of them is read without reading the others."""
+        self.folder_path = folder_path
+        self.index_path = os.path.join(folder_path, "index.json")
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'gene_amnt' : None, 'gene_size' : None, 'num_of_tracks' : 0,
+                            'size' : 0, 'generations' : {}}
+        if not 'num_of_tracks' in self.index:
+            self.index['num_of_tracks'] = 0
+
+    @staticmethod
+    def exists(folder_path : str):
+        """Returns if there's an archive in folder_path."""
+        return os.path.exists(os.path.join(folder_path, "index.json"))
+
+    def get_path(self, name : str):
+        """Returns path of the raw file with name."""
+        return os.path.join(self.folder_path, name + ".bin")
+
+    def get_generations(self):
+        """Returns sorted list with the generations in the archive."""
+        return sorted(int(x) for x in self.index['generations'])
+
+    def append(self, generation : int, population, fitness : list, features : list):
+        """Appends generation, with population array with shape (n, gene_amnt,
+        gene_size) and fitness and features of each individual."""
+        population = np.ascontiguousarray(population, dtype=np.float64)
+        fitness = np.ascontiguousarray(fitness, dtype=np.float64)
+        if self.index['gene_amnt'] == None:
+            self.index['gene_amnt'] = population.shape[1]
+            self.index['gene_size'] = population.shape[2]
+            if 'tracks' in features[0]:
+                self.index['num_of_tracks'] = len(features[0]['tracks'])
+        num_of_tracks = self.index['num_of_tracks']
+        features_array = np.empty(len(features), dtype=get_features_dtype(num_of_tracks))
+        for name in FEATURES_DTYPE.names:
+            features_array[name] = [x[name] for x in features]
+            if num_of_tracks > 0:
+                features_array['tracks_' + name] = [[y[name] for y in x['tracks']] for x in features]
+
+        # A generation appended again (a run resumed from the checkpoint
+        # before it) replaces it and the generations after it
+        key = str(generation)
+        if key in self.index['generations']:
+            self.index['size'] = self.index['generations'][key]['offset']
+            self.index['generations'] = {x : y for x, y in self.index['generations'].items()
+                                            if y['offset'] < self.index['size']}
+        # Written after the last indexed generation, so data of an interrupted
+        # append, not in the index, is overwritten
+        offset = self.index['size']
+        for name, array in [('population', population), ('fitness', fitness),
+                            ('features', features_array)]:
+            path = self.get_path(name)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                f.seek(offset*array[:1].nbytes)
+                f.write(array.tobytes())
+                f.truncate()
+        self.index['generations'][str(generation)] = {'offset' : self.index['size'],
+                                                        'size' : len(population)}
+        self.index['size'] += len(population)
+        self.write_index()
+
+    def write_index(self):
+        """Writes index, replacing the previous one only when it's complete."""
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def read(self, name : str, dtype, offset : int, shape : tuple):
+        """Returns array with shape read from the raw file with name, starting
+        in the individual offset. The file is mapped, not read."""
+        dtype = np.dtype(dtype)
+        individual = int(np.prod(shape[1:], dtype=np.int64))*dtype.itemsize
+        return np.memmap(self.get_path(name), dtype=dtype, mode='r',
+                            offset=offset*individual, shape=shape)
+
+    def load(self, generation : int):
+        """Returns dict with population, generation, features and fitness of
+        generation, as saved by AIGA.save."""
+        entry = self.index['generations'][str(generation)]
+        offset, size = entry['offset'], entry['size']
+        population = self.read('population', np.float64, offset,
+                        (size, self.index['gene_amnt'], self.index['gene_size']))
+        fitness = self.read('fitness', np.float64, offset, (size,))
+        num_of_tracks = self.index['num_of_tracks']
+        features = []
+        for x in self.read('features', get_features_dtype(num_of_tracks), offset, (size,)):
+            features.append({name : x[name].item() for name in FEATURES_DTYPE.names})
+            if num_of_tracks > 0:
+                features[-1]['tracks'] = [{name : x['tracks_' + name][i].item()
+                                            for name in FEATURES_DTYPE.names}
+                                            for i in range(num_of_tracks)]
+        return {
+            'population' : population,
+            'generation' : generation,
+            'features' : features,
+            'fitness' : fitness.tolist()
+        }
+
+    def export_json(self, generation : int, file_path : str):
+        """Writes generation in file_path with the json layout of gen_N.json."""
+        ai_info = self.load(generation)
+        ai_info['population'] = ai_info['population'].tolist()
+        with open(file_path, 'w') as f:
+            json.dump(ai_info, f)
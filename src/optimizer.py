@@ -0,0 +1,33 @@
+from abc import ABC, abstractmethod
+
+class Optimizer(ABC):
+    """Interface of the optimizers of the genomes driven by the controllers.
+    ask returns the genomes to be evaluated, the features of each one are
+    given with set_evaluation and, when all are evaluated, tell updates the
+    optimizer and proposes the next genomes."""
+
+    @abstractmethod
+    def ask(self):
+        """Returns array with the genomes to be evaluated, one per car."""
+
+    @abstractmethod
+    def set_evaluation(self, car_id : int, features : dict, exact = True):
+        """Sets the features of the genome of car_id."""
+
+    @abstractmethod
+    def population_evaluated(self):
+        """Returns if all genomes from ask were evaluated."""
+
+    @abstractmethod
+    def tell(self):
+        """Updates the optimizer with the features of the genomes evaluated.
+        Returns False when the optimization is over."""
+
+    @abstractmethod
+    def get_state(self):
+        """Returns dict with the state of the optimizer, besides the genomes,
+        saved in the checkpoint."""
+
+    @abstractmethod
+    def set_state(self, state : dict):
+        """Sets the state of the optimizer saved in the checkpoint."""
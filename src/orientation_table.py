@@ -0,0 +1,47 @@
+import numpy as np
+from functools import lru_cache
+
+class OrientationTable():
+    def __init__(self, car_width, car_height, number_of_visions, vision_length, amount_graphics):
+        """Precomputed orientations of the car structure, front and vision
+        segments, relative to the car surface. There's amount_graphics + 1
+        orientations, the first points to East and each one is rotated
+        clockwise by 360/amount_graphics degrees from the previous."""
+        self.surface_side = 1.4*max(max(car_width, car_height), 2*vision_length)
+        self.center = (round(self.surface_side/2), round(self.surface_side/2))
+
+        cx, cy = self.center
+        w, h = car_width, car_height
+        structure = np.array([  (cx - w/2, cy - h/2),
+                                (cx + w/2, cy - h/2),
+                                (cx + w/2, cy + h/2),
+                                (cx - w/2, cy + h/2) ])
+        front = np.array([      (cx - w/2, cy + h/4),
+                                (cx + w/2, cy + h/4),
+                                (cx + w/2, cy + h/2),
+                                (cx - w/2, cy + h/2) ])
+        vision_angles = np.radians(-np.linspace(-90, 90, number_of_visions))
+        seg_vision = np.stack([cx - np.sin(vision_angles)*vision_length,
+                                cy + np.cos(vision_angles)*vision_length], axis=1)
+
+        # -90 makes car orientation to East, each orientation rotates clockwise
+        step = 360//amount_graphics
+        angles = np.radians(-90 - step*np.arange(amount_graphics + 1))
+        cos = np.cos(angles)[:, None]
+        sin = np.sin(angles)[:, None]
+        def rotate(points):
+            px = points[:, 0] - cx
+            py = points[:, 1] - cy
+            ret = np.stack([cx + cos*px - sin*py, cy + sin*px + cos*py], axis=2)
+            # Shared by every car, so it must not be changed in place
+            ret.flags.writeable = False
+            return ret
+        self.structure = rotate(structure)
+        self.front = rotate(front)
+        self.seg_vision = rotate(seg_vision)
+
+@lru_cache(maxsize=None)
+def get_orientation_table(car_width, car_height, number_of_visions, vision_length, amount_graphics):
+    """Returns the OrientationTable for the received car dimensions, vision and
+    amount_graphics. Built only once and shared by every car."""
+    return OrientationTable(car_width, car_height, number_of_visions, vision_length, amount_graphics)
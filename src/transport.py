@@ -0,0 +1,118 @@
+import os
+import secrets
+import threading
+import queue
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+# Key of the first versions, it's public, so it's refused
+OLD_AUTHKEY = "car-racing"
+# Environment variable with the key, used if there's none in config
+AUTHKEY_ENV = "CAR_RACING_AUTHKEY"
+
+def get_authkey(config, generate = False):
+    """Returns the key that authenticates coordinator and workers, from
+    config (-authkey) or the environment variable CAR_RACING_AUTHKEY.
+    Messages are pickles, anyone with the key can run code in the
+    coordinator and in the workers. Without a key, a random one is created
+    and printed if generate is True. Returns None if there's no valid key."""
+    authkey = ""
+    if 'distributed' in config and 'authkey' in config['distributed']:
+        authkey = config['distributed']['authkey']
+    if not authkey and AUTHKEY_ENV in os.environ:
+        authkey = os.environ[AUTHKEY_ENV]
+    if authkey == OLD_AUTHKEY:
+        print("The authkey %s is public, use another one." % OLD_AUTHKEY)
+        return None
+    if not authkey and generate:
+        authkey = secrets.token_hex(16)
+        print("Authkey of the workers:", authkey)
+    if not authkey:
+        print("Missing authkey, use -authkey or the environment variable %s." % AUTHKEY_ENV)
+        return None
+    return authkey.encode()
+
+def parse_address(address : str):
+    """Returns address and family of multiprocessing.connection for address,
+    'host:port' for TCP or the path of a Unix socket."""
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return (host, int(port)), 'AF_INET'
+    return address, 'AF_UNIX'
+
+class TransportLocal(object):
+    def __init__(self, target, num_of_workers : int):
+        """Runs num_of_workers processes in this machine, each one calls
+        target with its end of a pipe."""
+        self.connections = []
+        self.processes = []
+        for i in range(num_of_workers):
+            conn, conn_worker = multiprocessing.Pipe()
+            self.processes.append(multiprocessing.Process(target=target, args=(conn_worker,)))
+            self.processes[-1].start()
+            conn_worker.close()
+            self.connections.append(conn)
+
+    def new_connections(self):
+        """Returns list with the connections of the workers that joined since
+        the last call."""
+        ret = self.connections
+        self.connections = []
+        return ret
+
+    def accepts_workers(self):
+        """Returns if workers can still join, local workers are only
+        started with the transport."""
+        return len(self.connections) > 0
+
+    def close(self):
+        """Waits for the workers, terminating the ones that are still running."""
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+
+class TransportSocket(object):
+    def __init__(self, address : str, authkey : bytes):
+        """Listens in address, TCP ('host:port') or Unix socket (path), for
+        workers. Workers can join at any moment. Only workers with authkey
+        are accepted, but the messages aren't encrypted, the port must not
+        be reachable from untrusted networks."""
+        address, family = parse_address(address)
+        self.listener = Listener(address, family, authkey=authkey)
+        self.connections = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+        self.thread.start()
+
+    def accept(self):
+        """Accepts workers until the listener is closed."""
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                # Closed listener or worker that failed the handshake
+                continue
+            self.connections.put(conn)
+
+    def new_connections(self):
+        """Returns list with the connections of the workers that joined since
+        the last call."""
+        ret = []
+        while not self.connections.empty():
+            ret.append(self.connections.get())
+        return ret
+
+    def accepts_workers(self):
+        """Returns if workers can still join."""
+        return not self.closed
+
+    def close(self):
+        """Stops accepting workers."""
+        self.closed = True
+        self.listener.close()
+
+def connect(address : str, authkey : bytes):
+    """Returns connection with the coordinator listening in address."""
+    address, family = parse_address(address)
+    return Client(address, family, authkey=authkey)
@@ -189,4 +189,34 @@ class View():
         # if self.num_frame%60 == 0:
         #     print("Avr. FPS (last %ds): %4.1f" % (\
         #                 self.acum_fps_window, self.sum_of_fps/len(self.acum_fps)))
-        self.screen.fill((255, 255, 255))
\ No newline at end of file
+        self.screen.fill((255, 255, 255))
+
+class ViewHeadless():
+    def __init__(self, config):
+        """Same interface as View, but without display, frame pacing or
+        event pumping, so the simulation runs as fast as the CPU allows."""
+        self.config = config
+        self.EPS = config['EPS']
+        self.width = config['width']
+        self.height = config['height']
+        self.fps = config['fps']
+
+        self.num_frame = 0
+        self.num_frame_now = 0
+
+    def draw_text(self, x, y, text, font, color = (255, 0, 255)):
+        """Nothing to draw without display."""
+        pass
+
+    def blit(self, surface, pos):
+        """Nothing to draw without display."""
+        pass
+
+    def set_data_ai_activation(self, population : list, visions : list, speeds : float):
+        """Nothing to present without display."""
+        pass
+
+    def update(self):
+        """Updates frame counters."""
+        self.num_frame += 1
+        self.num_frame_now += 1